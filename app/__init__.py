@@ -12,4 +12,4 @@ CORS(app)
 db = SQLAlchemy(app)
 migrate = Migrate(app, db)
 
-from app import routes, models
\ No newline at end of file
+from app import routes, models, commands
\ No newline at end of file
@@ -0,0 +1,186 @@
+import atexit
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from selenium import webdriver
+from selenium.common.exceptions import WebDriverException
+from selenium.webdriver.chrome.service import Service
+from webdriver_manager.chrome import ChromeDriverManager
+
+from app import app
+from app.politeness import host_concurrency
+
+
+class PooledDriver:
+    """プールから貸し出すWebDriver（開いたページ数を数える）"""
+    def __init__(self, driver):
+        self.driver = driver
+        self.pages = 0
+
+    def get(self, url):
+        self.pages += 1
+        return self.driver.get(url)
+
+    def __getattr__(self, name):
+        return getattr(self.driver, name)
+
+
+class BrowserPool:
+    """ヘッドレスChromeを起動したまま使い回すプール
+
+    chromedriverのパスは最初に1回だけ解決し，起動したブラウザは返却後も
+    閉じずに次のクロールで使う．BROWSER_MAX_PAGESページ開いたブラウザと
+    エラーになったブラウザは返却時に閉じて，次に借りるときに起動し直す．
+    同時に貸し出すのはBROWSER_POOL_SIZE個まで．
+    factoryを渡すとChromeの代わりにそれでWebDriverを作る．
+    """
+    def __init__(self, size=None, max_pages=None, factory=None):
+        self._lock = threading.Lock()
+        self._idle = []
+        self._size = size
+        self._slots = None
+        self._driver_path = None
+        self.max_pages = max_pages
+        self.factory = factory or self._create_driver
+        self.stats = {'created': 0, 'reused': 0, 'recycled': 0}
+
+    def _get_slots(self):
+        with self._lock:
+            if self._slots is None:
+                self._slots = threading.BoundedSemaphore(self._size or app.config['BROWSER_POOL_SIZE'])
+            return self._slots
+
+    def driver_path(self):
+        """chromedriverのパス（設定が無ければ1回だけダウンロードして解決する）"""
+        with self._lock:
+            if self._driver_path is None:
+                self._driver_path = app.config['CHROMEDRIVER_PATH'] or ChromeDriverManager().install()
+            return self._driver_path
+
+    def _create_driver(self):
+        options = webdriver.ChromeOptions()
+        if app.config['BROWSER_HEADLESS']:
+            options.add_argument('--headless=new')
+        options.add_argument('--no-sandbox')
+        options.add_argument('--disable-dev-shm-usage')
+        options.add_argument('--disable-gpu')
+        options.add_argument('--window-size=1280,1024')
+        return webdriver.Chrome(service=Service(self.driver_path()), options=options)
+
+    def _quit(self, pooled):
+        try:
+            pooled.driver.quit()
+        except Exception:
+            pass
+
+    def acquire(self):
+        self._get_slots().acquire()
+        with self._lock:
+            pooled = self._idle.pop() if self._idle else None
+        if pooled is not None:
+            self.stats['reused'] += 1
+            return pooled
+        try:
+            pooled = PooledDriver(self.factory())
+        except Exception:
+            self._get_slots().release()
+            raise
+        self.stats['created'] += 1
+        return pooled
+
+    def release(self, pooled, broken=False):
+        max_pages = self.max_pages or app.config['BROWSER_MAX_PAGES']
+        if broken or pooled.pages >= max_pages:
+            # メモリが増え続けないように閉じて，次は新しく起動する
+            self._quit(pooled)
+            self.stats['recycled'] += 1
+        else:
+            with self._lock:
+                self._idle.append(pooled)
+        self._get_slots().release()
+
+    @contextmanager
+    def driver(self):
+        """ブラウザを借りて，ブロックを抜けたら返す"""
+        pooled = self.acquire()
+        broken = False
+        try:
+            yield pooled
+        except WebDriverException:
+            broken = True
+            raise
+        finally:
+            if not broken:
+                broken = not self._reset(pooled)
+            self.release(pooled, broken)
+
+    def _reset(self, pooled):
+        """次に借りる人のために余分なタブを閉じる（失敗したらFalse）"""
+        try:
+            handles = pooled.window_handles
+            for handle in handles[1:]:
+                pooled.switch_to.window(handle)
+                pooled.close()
+            pooled.switch_to.window(handles[0])
+            return True
+        except Exception:
+            return False
+
+    def _load_in_tabs(self, pooled, func, urls, prepare):
+        """urlsをタブで同時に読み込み，タブごとにfunc(driver, url)を実行する"""
+        main_handle = pooled.current_window_handle
+        handles = []
+        for url in urls:
+            if prepare is not None:
+                prepare(url)
+            known = set(pooled.window_handles)
+            # window.open()は読み込みを待たずに返るので，タブの読み込みが重なる
+            pooled.execute_script('window.open(arguments[0], "_blank");', url)
+            pooled.pages += 1
+            handles.append(next(handle for handle in pooled.window_handles if handle not in known))
+        results = []
+        for handle, url in zip(handles, urls):
+            pooled.switch_to.window(handle)
+            results.append(func(pooled, url))
+            pooled.close()
+        pooled.switch_to.window(main_handle)
+        return results
+
+    def map(self, func, urls, key, prepare=None, tabs=None):
+        """urlsを順に開いてfunc(driver, url)を並列に実行し，結果を元の順番で返すイテレーター
+
+        ホストの並列数だけブラウザを借り，それぞれがtabs個ずつのタブで読み込む．
+        prepare(url)は各ページを開く直前に呼ぶ（robots.txtの確認や間隔の調整）．
+        """
+        tabs = tabs or app.config['BROWSER_TABS']
+        batches = [urls[i:i + tabs] for i in range(0, len(urls), tabs)]
+
+        def run(batch):
+            # 同時に動く他のmap()と取り合っても詰まらないように，まとまりごとに借りて返す
+            with self.driver() as pooled:
+                if len(batch) == 1:
+                    if prepare is not None:
+                        prepare(batch[0])
+                    pooled.get(batch[0])
+                    return [func(pooled, batch[0])]
+                return self._load_in_tabs(pooled, func, batch, prepare)
+
+        workers = min(host_concurrency(key), self._size or app.config['BROWSER_POOL_SIZE'], max(len(batches), 1))
+        executor = ThreadPoolExecutor(max_workers=workers)
+        try:
+            for results in executor.map(run, batches):
+                yield from results
+        finally:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def close(self):
+        """待機中のブラウザを全て閉じる"""
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for pooled in idle:
+            self._quit(pooled)
+
+
+browser_pool = BrowserPool()
+atexit.register(browser_pool.close)
@@ -0,0 +1,131 @@
+import time
+import threading
+from collections import namedtuple
+from urllib.parse import urljoin
+
+from app import app
+from app.models import App, CacheVersion
+
+
+class VersionedCache:
+    """CacheVersionのバージョンが変わるまで値を使い回すキャッシュ
+
+    バージョンの確認はCACHE_VERSION_CHECK_INTERVAL秒に1回だけ行うので，
+    他のプロセスで更新された場合もその間隔で反映される．
+    作り直している間に来たリクエストには古い値を返す．
+    backgroundなら，バージョンの更新を見つけたリクエストも待たせずに
+    別のスレッドで作り直し，できるまで古い値を返す．
+    """
+    def __init__(self, names, loader, background=False):
+        self.names = (names,) if isinstance(names, str) else tuple(names)
+        self.loader = loader
+        self.background = background
+        self._lock = threading.Lock()
+        self._value = None
+        self._version = None
+        self._next_check = 0
+        self._reload_lock = threading.Lock()
+
+    @property
+    def ready(self):
+        """このプロセスで値を作ってあるか"""
+        return self._value is not None
+
+    def get(self, wait=True):
+        """値を返す．waitでなければ，まだ値が無いときは待たずに作り始めてNoneを返す"""
+        now = time.monotonic()
+        if self._value is not None and now < self._next_check:
+            return self._value
+        if self._value is None and not wait:
+            self.reload_in_background()
+            return None
+        if not self._lock.acquire(blocking=self._value is None):
+            return self._value
+        try:
+            if self._value is None or now >= self._next_check:
+                version = CacheVersion.get_versions(*self.names)
+                if self._value is not None and version != self._version and self.background:
+                    self.reload_in_background()
+                elif self._value is None or version != self._version:
+                    self._value = self.loader()
+                    self._version = version
+                self._next_check = now + app.config['CACHE_VERSION_CHECK_INTERVAL']
+            return self._value
+        finally:
+            self._lock.release()
+
+    def reload(self):
+        """値を作り直す（データを更新したプロセスから呼ぶ）"""
+        with self._lock:
+            version = CacheVersion.get_versions(*self.names)
+            self._value = self.loader()
+            self._version = version
+            self._next_check = time.monotonic() + app.config['CACHE_VERSION_CHECK_INTERVAL']
+        return self._value
+
+    def reload_in_background(self):
+        """別のスレッドで値を作り直す（作り直している途中なら何もしない）"""
+        if not self._reload_lock.acquire(blocking=False):
+            return
+
+        def run():
+            try:
+                with app.app_context():
+                    self.reload()
+            except Exception as e:
+                print(f'failed to reload cache {self.names}: {e}')
+            finally:
+                self._reload_lock.release()
+
+        threading.Thread(target=run, daemon=True).start()
+
+    def invalidate(self):
+        """このプロセスのキャッシュを捨てる"""
+        with self._lock:
+            self._value = None
+
+
+PLATFORM_TYPE_LABELS = {
+    'app': 'アプリ',
+    'web': 'Web',
+    'both': 'アプリ, Web',
+}
+
+AppInfo = namedtuple('AppInfo', [
+    'id',
+    'name',
+    'abj_management_number',
+    'company_name',
+    'service_type',
+    'img_url',
+    'abs_img_url',
+    'platform_type',
+    'platform_type_label',
+    'app_store_url',
+    'google_play_url',
+    'site_url',
+])
+
+
+def load_app_registry():
+    """Appテーブルからid順のAppInfoの辞書を作る"""
+    registry = {}
+    for app_record in App.query.order_by(App.id).all():
+        registry[app_record.id] = AppInfo(
+            id=app_record.id,
+            name=app_record.name,
+            abj_management_number=app_record.abj_management_number,
+            company_name=app_record.company_name,
+            service_type=app_record.service_type,
+            img_url=app_record.img_url,
+            abs_img_url=urljoin(app.config['DEPLOY_URL'], app_record.img_url),
+            platform_type=app_record.platform_type,
+            platform_type_label=PLATFORM_TYPE_LABELS.get(app_record.platform_type, '-'),
+            app_store_url=app_record.app_store_url,
+            google_play_url=app_record.google_play_url,
+            site_url=app_record.site_url,
+        )
+    return registry
+
+
+app_registry = VersionedCache('app', load_app_registry)
@@ -0,0 +1,57 @@
+from collections import namedtuple
+
+from app import app, db
+from app.models import Comic, Crawl
+
+
+# 一覧のAPIで返すComicとCrawlの列だけを持つ行（ORMのオブジェクトは作らない）．
+# serializersからはComicとCrawlと同じように読める
+ComicRow = namedtuple('ComicRow', ['id', 'title', 'title_kana', 'author', 'raw_author', 'crawls'])
+CrawlRow = namedtuple('CrawlRow', ['app_id', 'url', 'crawled_at'])
+
+
+def comic_rows_query(comics=None):
+    """ComicとそのCrawlの必要な列だけをLEFT JOINで1回で読むクエリ
+
+    comicsにComicの列を持つサブクエリを渡すと，その行だけを読む．
+    """
+    columns = Comic.__table__.c if comics is None else comics.c
+    return db.session.query(
+        columns.id, columns.title, columns.title_kana, columns.author, columns.raw_author,
+        Crawl.app_id, Crawl.url, Crawl.crawled_at,
+    ).outerjoin(Crawl, Crawl.comic_id == columns.id)
+
+
+def group_rows(rows):
+    """Comicごとに並んだ行をComicRowにまとめる（Crawlが無ければcrawlsは空）"""
+    comic = None
+    for comic_id, title, title_kana, author, raw_author, app_id, url, crawled_at in rows:
+        if comic is None or comic.id != comic_id:
+            if comic is not None:
+                yield comic
+            comic = ComicRow(comic_id, title, title_kana, author, raw_author, [])
+        if app_id is not None:
+            comic.crawls.append(CrawlRow(app_id, url, crawled_at))
+    if comic is not None:
+        yield comic
+
+
+def load_comic(comic_id):
+    """idのComicRow（無ければNone）"""
+    rows = comic_rows_query().filter(Comic.id == comic_id).order_by(Crawl.id).all()
+    return next(group_rows(rows), None)
+
+
+def load_comics(comic_ids):
+    """comic_idsの順番でComicRowのリストを返す（無いidは飛ばす）"""
+    if not comic_ids:
+        return []
+    rows = comic_rows_query().filter(Comic.id.in_(comic_ids)).order_by(Comic.id, Crawl.id).all()
+    comic_dict = {comic.id: comic for comic in group_rows(rows)}
+    return [comic_dict[comic_id] for comic_id in comic_ids if comic_id in comic_dict]
+
+
+def iter_comic_rows():
+    """全てのComicRowをid順に少しずつ読み込む"""
+    rows = comic_rows_query().order_by(Comic.id, Crawl.id).yield_per(app.config['STREAM_YIELD_PER'])
+    return group_rows(rows)
@@ -0,0 +1,61 @@
+import click
+
+from app import app
+from app.models import App, Comic
+from app.crawl_runner import crawl_all
+from app.crawl_jobs import run_worker
+from app.crawl_schedule import build_schedule, run_scheduler
+
+
+@app.cli.command('crawl-all')
+@click.option('--workers', type=int, default=None, help='並列数（指定しなければCRAWL_WORKERS）')
+def crawl_all_command(workers):
+    """全てのアプリを並列にクロールして保存する"""
+    results = crawl_all(max_workers=workers)
+    for name, crawl_res in results.items():
+        print(f'{name}: {crawl_res["dict"]}')
+
+
+@app.cli.command('crawl-worker')
+@click.option('--concurrency', type=int, default=None, help='同時に実行するジョブの数（指定しなければCRAWL_JOB_CONCURRENCY）')
+@click.option('--once', is_flag=True, help='実行待ちのジョブが無くなったら終わる')
+def crawl_worker_command(concurrency, once):
+    """POST /crawlで追加されたクロールのジョブを実行する"""
+    run_worker(concurrency=concurrency, once=once)
+
+
+@app.cli.command('crawl-scheduler')
+@click.option('--once', is_flag=True, help='1回だけ確認して終わる（cronから呼ぶとき）')
+@click.option('--dry-run', is_flag=True, help='予定を表示するだけでジョブは追加しない')
+def crawl_scheduler_command(once, dry_run):
+    """期限の来たアプリのクロールのジョブを追加する"""
+    if dry_run:
+        for entry in build_schedule():
+            rate = '-' if entry.change_rate is None else f'{entry.change_rate:.3f}'
+            print(f'{entry.next_run_at:%Y/%m/%d %H:%M} {entry.interval / 3600:6.1f}h rate {rate} '
+                  f'failures {entry.failures} {entry.job_status or ""} {entry.app_name}')
+        return
+    run_scheduler(once=once)
+
+
+@app.cli.command('sync-apps')
+@click.option('--icons', is_flag=True, help='反映した後にアイコンも取得する')
+def sync_apps_command(icons):
+    """app_info.csvの差分をAppテーブルにまとめて反映する"""
+    App.sync_from_csv()
+    if icons:
+        App.update_icons()
+
+
+@app.cli.command('sync-icons')
+@click.option('--refresh', is_flag=True, help='アイコンがあるアプリも取得し直す')
+def sync_icons_command(refresh):
+    """アプリのアイコンを並列に取得して保存する"""
+    App.update_icons(refresh=refresh)
+
+
+@app.cli.command('backfill-search-keys')
+@click.option('--refresh', is_flag=True, help='search_keyがあるComicも作り直す（正規化の方法を変えたとき）')
+def backfill_search_keys_command(refresh):
+    """既存のComicのキーワード検索用のsearch_keyを埋める"""
+    Comic.backfill_search_keys(refresh=refresh)
@@ -0,0 +1,99 @@
+import gzip
+
+from flask import request
+
+from app import app
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+
+def accepted_encodings(accept_encoding):
+    """Accept-Encodingからエンコーディング→qの辞書を作る（q=0の拒否も残す）"""
+    encodings = {}
+    for part in (accept_encoding or '').split(','):
+        name, _, params = part.strip().partition(';')
+        name = name.strip().lower()
+        if not name:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                continue
+        encodings[name] = q
+    return encodings
+
+
+def choose_encoding(accept_encoding):
+    """使えるエンコーディングのうちクライアントのqが最も高いもの（同じならbr）．無ければNone
+
+    明示されたエンコーディングのqを優先し，無いときだけ*のqを使う．qが0のものは使わない．
+    """
+    encodings = accepted_encodings(accept_encoding)
+    best = None
+    for encoding in available_encodings():
+        q = encodings.get(encoding, encodings.get('*'))
+        if q is not None and q > 0 and (best is None or q > best[1]):
+            best = (encoding, q)
+    return best[0] if best else None
+
+
+def compress(body, encoding, level=None):
+    """bodyをencodingで圧縮する（levelを指定しなければCOMPRESS_LEVELSの値）
+
+    gzipはmtimeを0にして，同じbodyからは同じバイト列を作る．
+    """
+    if level is None:
+        level = app.config['COMPRESS_LEVELS'][encoding]
+    if encoding == 'gzip':
+        return gzip.compress(body, compresslevel=level, mtime=0)
+    if encoding == 'br':
+        return brotli.compress(body, quality=level)
+    raise ValueError(f'unsupported encoding {encoding}')
+
+
+def available_encodings():
+    return ['br', 'gzip'] if brotli is not None else ['gzip']
+
+
+def compress_all(body):
+    """使える全てのエンコーディングでbodyを圧縮した辞書（COMPRESS_CACHED_LEVELSで強めに圧縮する）"""
+    if not app.config['COMPRESS_RESPONSES'] or len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return {}
+    levels = app.config['COMPRESS_CACHED_LEVELS']
+    return {encoding: compress(body, encoding, levels[encoding]) for encoding in available_encodings()}
+
+
+def set_encoding(response, encoding, body):
+    """圧縮したbodyとContent-Encodingをレスポンスに設定する（ETagはエンコーディングごとに変える）"""
+    response.set_data(body)
+    response.headers['Content-Encoding'] = encoding
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak=weak)
+    return response
+
+
+def compress_response(response):
+    """APIのレスポンスをAccept-Encodingに合わせて圧縮する（after_requestから呼ぶ）
+
+    ストリーミングとファイル，既に圧縮したもの，COMPRESS_MIN_SIZEより小さいものは圧縮しない．
+    """
+    if not app.config['COMPRESS_RESPONSES'] or response.mimetype not in app.config['COMPRESS_MIMETYPES']:
+        return response
+    response.vary.add('Accept-Encoding')
+    if (response.status_code != 200 or response.direct_passthrough or response.is_streamed
+            or 'Content-Encoding' in response.headers):
+        return response
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding is None:
+        return response
+    body = response.get_data()
+    if len(body) < app.config['COMPRESS_MIN_SIZE']:
+        return response
+    return set_encoding(response, encoding, compress(body, encoding))
@@ -8,4 +8,106 @@ CORS_ORIGINS = ["*"]
 
 APP_CSV_PATH = 'app_info.csv'
 
+# クロール結果の保存方法（'diff': 差分だけ書き込む, 'replace': 全て入れ直す）
+CRAWL_SAVE_MODE = 'diff'
+
+# 全アプリをクロールするときの並列数
+CRAWL_WORKERS = 4
+
+# 同じ基盤で動いているため，同時にクロールせずアクセス間隔も共有するホスト
+CRAWL_HOST_GROUPS = {
+    'comic-days.com': 'gigaviewer',
+    'pocket.shonenmagazine.com': 'gigaviewer',
+    'shonenjumpplus.com': 'gigaviewer',
+    'www.sunday-webry.com': 'gigaviewer',
+    'www.ganganonline.com': 'square-enix',
+    'magazine.jp.square-enix.com': 'square-enix',
+}
+
+# 詳細ページを並列に取得するときの同じホストへの同時リクエスト数（CRAWL_HOST_GROUPSのキーでも指定できる）
+CRAWL_DEFAULT_CONCURRENCY = 4
+CRAWL_HOST_CONCURRENCY = {}
+
+# HTTPクライアントの設定（接続を使い回す数，再試行の回数と間隔，タイムアウト秒数）
+FETCH_POOL_SIZE = 10
+FETCH_RETRIES = 3
+FETCH_BACKOFF_FACTOR = 1
+FETCH_TIMEOUT = 30
+# 応答時間のこの倍数をCrawl-delayより優先し，間隔はFETCH_MAX_DELAY秒まで広げる
+FETCH_LATENCY_FACTOR = 1
+FETCH_MAX_DELAY = 60
+
+# クロールのジョブを1つのワーカーで同時に実行する数，ジョブを確認する間隔（秒），
+# この秒数ハートビートの無い実行中のジョブはワーカーが落ちたとみなして失敗にする．
+# 同時に実行するとsave()も並行するので，既定では1つずつ実行する
+CRAWL_JOB_CONCURRENCY = 1
+CRAWL_JOB_POLL_INTERVAL = 2
+CRAWL_JOB_STALE_SECONDS = 300
+
+# クロールの予定（秒）．変化の無いアプリは間隔を倍にしていき，変化のあるアプリは
+# 1回あたりの作品の変化がCRAWL_SCHEDULE_TARGET_CHANGEの割合くらいになるように間隔を縮める．
+# 失敗したらCRAWL_SCHEDULE_RETRY_INTERVALから倍にしながら再試行する
+CRAWL_SCHEDULE_BASE_INTERVAL = 60 * 60 * 24
+CRAWL_SCHEDULE_MIN_INTERVAL = 60 * 60 * 6
+CRAWL_SCHEDULE_MAX_INTERVAL = 60 * 60 * 24 * 7
+CRAWL_SCHEDULE_TARGET_CHANGE = 0.02
+CRAWL_SCHEDULE_RETRY_INTERVAL = 60 * 60
+# 予定を立てるときに読むCrawlHistoryの日数（CRAWL_SCHEDULE_MAX_INTERVALより長くする）
+CRAWL_SCHEDULE_LOOKBACK_DAYS = 30
+# 実行待ちと実行中を合わせたジョブの上限と，期限を確認する間隔（秒）
+CRAWL_SCHEDULE_MAX_ACTIVE = 4
+CRAWL_SCHEDULE_POLL_INTERVAL = 60
+
+# robots.txtを取得し直すまでの秒数と，取得した内容を保存するディレクトリ（Noneなら保存しない）
+ROBOTS_TXT_TTL = 60 * 60 * 24
+ROBOTS_TXT_CACHE_DIR = None
+
+# タイトルのふりがなをメモリに覚えておく件数
+KANA_CACHE_SIZE = 100000
+
+# 使い回すヘッドレスChromeの数，1つのブラウザで開いたら起動し直すページ数，同時に開くタブの数
+BROWSER_POOL_SIZE = 4
+BROWSER_MAX_PAGES = 200
+BROWSER_TABS = 4
+BROWSER_HEADLESS = True
+# chromedriverのパス（Noneならwebdriver_managerで1回だけ取得する）
+CHROMEDRIVER_PATH = None
+
+# HTMLの解析方法（'fast'ならlxmlで必要な要素だけ，'full'ならhtml.parserでページ全体）
+HTML_PARSE_MODE = 'fast'
+
+# アイコンを同時に取得する数（同じホストへはクロールと同じ間隔を空ける）と，保存するときの大きさ（ピクセル）
+ICON_WORKERS = 8
+ICON_SIZE = 128
+
+# Seleniumで要素が表示されるまで待つ最大の秒数
+SELENIUM_WAIT_TIMEOUT = 10
+
+# 入力候補を返す件数の既定値と上限，上位を作っておく接頭辞の文字数
+SUGGEST_LIMIT = 10
+SUGGEST_MAX_LIMIT = 20
+SUGGEST_PREFIX_CACHE_LENGTH = 2
+# 最初のリクエストで検索と入力候補のインデックスをバックグラウンドで作り始めるか
+SEARCH_INDEX_WARM_UP = True
+# 最初のリクエストで全件のAPIのスナップショットをバックグラウンドで作り始めるか
+SNAPSHOT_WARM_UP = True
+
+# APIのJSONの書き出し方（'orjson'ならorjsonがあれば使う，'json'なら標準のjson）
+JSON_ENCODER = 'orjson'
+
+# APIのレスポンスをAccept-Encodingに合わせてgzipかbrotli（Brotliがあれば）で圧縮する．
+# COMPRESS_MIN_SIZEバイトより小さいものは圧縮しない．COMPRESS_LEVELSはリクエストごとに
+# 圧縮するとき，COMPRESS_CACHED_LEVELSは全件のスナップショットを作るときに1回だけ圧縮するときの強さ
+COMPRESS_RESPONSES = True
+COMPRESS_MIN_SIZE = 1024
+COMPRESS_MIMETYPES = ['application/json', 'text/html']
+COMPRESS_LEVELS = {'gzip': 6, 'br': 4}
+COMPRESS_CACHED_LEVELS = {'gzip': 9, 'br': 9}
+
+# キャッシュのバージョンを確認する間隔（秒）
+CACHE_VERSION_CHECK_INTERVAL = 5
+
+# ストリーミングで返すときに一度にDBから読む件数
+STREAM_YIELD_PER = 500
+
 DEPLOY_URL = 'https://comicsearchprojectbackend-production.up.railway.app/'
\ No newline at end of file
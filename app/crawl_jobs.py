@@ -0,0 +1,88 @@
+import os
+import time
+import socket
+import datetime
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, db
+from app.models import App, CrawlJob
+from app.crawler import ComicCrawler
+
+
+def run_job(job_id, crawlers):
+    """ジョブを1つ実行する（スレッドから呼べるようにapp_contextを作る）
+
+    実行中のComicCrawlerはcrawlersに入れておき，ワーカーが進み具合を記録する．
+    """
+    with app.app_context():
+        job = db.session.get(CrawlJob, job_id)
+        app_record = db.session.get(App, job.app_id)
+        try:
+            crawler = ComicCrawler(app_record)
+            crawlers[job_id] = crawler
+            CrawlJob.set(job_id, phase='crawling')
+            crawl_res = crawler.crawl()
+            if crawl_res['status_code'] != 200:
+                CrawlJob.finish(job_id, 'failure', pages=crawler.pages, detail=crawl_res['dict'].get('detail'))
+                return
+            comics_num = len(crawler.comics)
+            CrawlJob.set(job_id, phase='saving', pages=crawler.pages, comics_num=comics_num)
+            crawler.save()
+            crawl_history = crawler.crawl_history
+            CrawlJob.finish(
+                job_id, 'success',
+                added_num=crawl_history.added_num,
+                removed_num=crawl_history.removed_num,
+                unchanged_num=crawl_history.unchanged_num,
+            )
+        except Exception as e:
+            db.session.rollback()
+            CrawlJob.finish(job_id, 'failure', detail=str(e)[:1000])
+        finally:
+            crawlers.pop(job_id, None)
+
+
+def run_worker(concurrency=None, poll_interval=None, once=False):
+    """実行待ちのジョブを取り出して，concurrency個まで並列に実行し続ける
+
+    ワーカーは何プロセス起動してもよい（ジョブはDB上で1つのワーカーだけが取る）．
+    onceならジョブが無くなったら終わる．
+    """
+    concurrency = concurrency or app.config['CRAWL_JOB_CONCURRENCY']
+    poll_interval = poll_interval or app.config['CRAWL_JOB_POLL_INTERVAL']
+    worker = f'{socket.gethostname()}:{os.getpid()}'
+    running = {}
+    crawlers = {}
+    print(f'worker {worker} started (concurrency {concurrency})')
+    executor = ThreadPoolExecutor(max_workers=concurrency)
+    try:
+        while True:
+            failed = CrawlJob.fail_stale(app.config['CRAWL_JOB_STALE_SECONDS'])
+            if failed:
+                print(f'{failed} stale jobs failed')
+            for job_id, future in list(running.items()):
+                if future.done():
+                    del running[job_id]
+                    job = db.session.get(CrawlJob, job_id)
+                    db.session.refresh(job)
+                    print(f'job {job_id} {job.status} {job.detail or ""}')
+            while len(running) < concurrency:
+                job_id = CrawlJob.claim(worker)
+                if job_id is None:
+                    break
+                print(f'job {job_id} started')
+                running[job_id] = executor.submit(run_job, job_id, crawlers)
+            # 実行中のジョブのハートビートと進み具合を記録する
+            now = datetime.datetime.now()
+            for job_id in running:
+                crawler = crawlers.get(job_id)
+                values = {'heartbeat_at': now}
+                if crawler is not None:
+                    values['pages'] = crawler.pages
+                CrawlJob.query.filter_by(id=job_id, status='running').update(values)
+            db.session.commit()
+            if once and not running:
+                break
+            time.sleep(poll_interval)
+    finally:
+        executor.shutdown(wait=True)
@@ -0,0 +1,53 @@
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app, db
+from app.models import App
+from app.crawler import ComicCrawler
+from app.politeness import politeness_key
+
+
+def crawl_app(app_id):
+    """1つのアプリをクロールして保存する（スレッドから呼べるようにapp_contextを作る）"""
+    with app.app_context():
+        app_record = db.session.get(App, app_id)
+        try:
+            crawler = ComicCrawler(app_record)
+            crawl_res = crawler.crawl()
+            if crawl_res['status_code'] == 200:
+                crawler.save()
+        except Exception as e:
+            crawl_res = {'dict': {'status': 'failure', 'detail': str(e)}, 'status_code': 500}
+        return app_record.name, crawl_res
+
+
+def crawl_apps_in_order(app_ids):
+    """同じ基盤のアプリは同時にクロールしないように順番に処理する"""
+    return [crawl_app(app_id) for app_id in app_ids]
+
+
+def crawlable_apps():
+    """クロールできるアプリ（他のアプリと一緒に保存されるものは除く）"""
+    names = [name for name in ComicCrawler.CRAWL_FUNCS if name not in ComicCrawler.CRAWLED_WITH]
+    return App.query.filter(App.name.in_(names)).order_by(App.id).all()
+
+
+def crawl_all(max_workers=None):
+    """全てのアプリを並列にクロールする
+
+    アクセス間隔の単位（ホストか，同じ基盤のホストのまとまり）ごとにグループにして，
+    グループの中は順番に，グループ同士は並列に処理する．
+    間隔自体はRobotsTxt.apply_crawl_delay()がホストごとに全スレッドで共有して守る．
+    保存はCrawler.saveの中で1つずつ行う（同じタイトルのComicはComic.titleのユニーク制約で1つにまとまる）．
+    """
+    groups = defaultdict(list)
+    for app_record in crawlable_apps():
+        groups[politeness_key(app_record.site_url or '')].append(app_record.id)
+    max_workers = max_workers or app.config['CRAWL_WORKERS']
+
+    results = {}
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for group_results in executor.map(crawl_apps_in_order, groups.values()):
+            for name, crawl_res in group_results:
+                results[name] = crawl_res
+    return results
@@ -0,0 +1,140 @@
+import time
+import datetime
+from collections import namedtuple, defaultdict
+
+from app import app, db
+from app.models import CrawlHistory, CrawlJob
+from app.crawl_runner import crawlable_apps
+
+
+ScheduleEntry = namedtuple('ScheduleEntry', [
+    'app_id', 'app_name', 'last_success_at', 'last_failure_at', 'failures',
+    'change_rate', 'interval', 'next_run_at', 'job_status',
+])
+
+
+def change_rate(history, prev_success=None):
+    """1回のクロールで変わった作品の割合（分からなければNone）
+
+    差分で保存したときは追加と削除の数から，そうでなければ前回の成功との作品数の差から求める．
+    """
+    if history.added_num is not None and history.removed_num is not None:
+        return (history.added_num + history.removed_num) / max(history.comics_num or 0, 1)
+    if prev_success is not None and prev_success.comics_num:
+        return abs((history.comics_num or 0) - prev_success.comics_num) / prev_success.comics_num
+    return None
+
+
+def crawl_interval(successes):
+    """最近の成功したクロールの変化の大きさから，次のクロールまでの間隔（秒）を決める
+
+    変化が無ければ続いた回数だけ間隔を倍にしていき，変化があれば
+    1回あたりの変化がCRAWL_SCHEDULE_TARGET_CHANGEくらいになる間隔にする．
+    """
+    config = app.config
+    base = config['CRAWL_SCHEDULE_BASE_INTERVAL']
+    rates = []
+    for prev_success, history in zip([None] + successes[:-1], successes):
+        rates.append(change_rate(history, prev_success))
+    rates = [rate for rate in rates if rate is not None]
+    if not rates:
+        return base, None
+
+    unchanged = 0
+    for rate in reversed(rates):
+        if rate > 0:
+            break
+        unchanged += 1
+    if unchanged:
+        interval = base * 2 ** unchanged
+        rate = 0
+    else:
+        # 最近の変化ほど重くした平均
+        rate = rates[0]
+        for value in rates[1:]:
+            rate = rate * 0.5 + value * 0.5
+        interval = base * config['CRAWL_SCHEDULE_TARGET_CHANGE'] / rate
+    interval = min(max(interval, config['CRAWL_SCHEDULE_MIN_INTERVAL']), config['CRAWL_SCHEDULE_MAX_INTERVAL'])
+    return interval, rate
+
+
+def plan_app(app_record, histories, job_status, now):
+    """1つのアプリの次のクロールの予定を立てる"""
+    config = app.config
+    successes = [history for history in histories if history.status == 'success']
+    last_success = successes[-1] if successes else None
+    # 最後の成功より後に続いた失敗
+    failures = [history for history in histories
+                if history.status == 'failure' and (last_success is None or history.id > last_success.id)]
+    interval, rate = crawl_interval(successes[-5:])
+
+    if failures:
+        # 失敗が続くほど間隔を空けて再試行する（通常の間隔より長くはしない）
+        backoff = config['CRAWL_SCHEDULE_RETRY_INTERVAL'] * 2 ** (len(failures) - 1)
+        next_run_at = failures[-1].crawled_at + datetime.timedelta(seconds=min(backoff, interval))
+    elif last_success is not None:
+        next_run_at = last_success.crawled_at + datetime.timedelta(seconds=interval)
+    else:
+        next_run_at = now
+    return ScheduleEntry(
+        app_id=app_record.id,
+        app_name=app_record.name,
+        last_success_at=last_success.crawled_at if last_success else None,
+        last_failure_at=failures[-1].crawled_at if failures else None,
+        failures=len(failures),
+        change_rate=rate,
+        interval=interval,
+        next_run_at=next_run_at,
+        job_status=job_status,
+    )
+
+
+def build_schedule(now=None):
+    """クロールできる全てのアプリの予定を，次のクロールが早い順に返す
+
+    CrawlHistoryは最近CRAWL_SCHEDULE_LOOKBACK_DAYS日分だけを1回で読む
+    （それより前にしか成功していなければ，どのみち期限を過ぎている）．
+    """
+    now = now or datetime.datetime.now()
+    since = now - datetime.timedelta(days=app.config['CRAWL_SCHEDULE_LOOKBACK_DAYS'])
+    histories = defaultdict(list)
+    # ORDER BY idを付けるとcrawled_atのインデックスを使わなくなるので，並べ替えはアプリごとに行う
+    for history in CrawlHistory.query.filter(CrawlHistory.crawled_at >= since):
+        histories[history.app_id].append(history)
+    for app_histories in histories.values():
+        app_histories.sort(key=lambda history: history.id)
+    job_status = dict(db.session.query(CrawlJob.app_id, CrawlJob.status).filter(CrawlJob.active_app_id.isnot(None)))
+    schedule = [plan_app(app_record, histories[app_record.id], job_status.get(app_record.id), now)
+                for app_record in crawlable_apps()]
+    return sorted(schedule, key=lambda entry: (entry.next_run_at, entry.app_id))
+
+
+def dispatch_due(now=None):
+    """期限の来たアプリのジョブを，実行待ちと実行中を合わせてCRAWL_SCHEDULE_MAX_ACTIVE個まで追加する
+
+    期限を一番過ぎているものから追加する．追加したジョブのリストを返す．
+    """
+    now = now or datetime.datetime.now()
+    active = CrawlJob.query.filter(CrawlJob.active_app_id.isnot(None)).count()
+    slots = app.config['CRAWL_SCHEDULE_MAX_ACTIVE'] - active
+    jobs = []
+    for entry in build_schedule(now):
+        if slots <= 0:
+            break
+        if entry.job_status is not None or entry.next_run_at > now:
+            continue
+        job, created = CrawlJob.enqueue(entry.app_id)
+        if created:
+            jobs.append(job)
+            slots -= 1
+    return jobs
+
+
+def run_scheduler(once=False):
+    """CRAWL_SCHEDULE_POLL_INTERVAL秒ごとに期限の来たアプリのジョブを追加し続ける"""
+    while True:
+        for job in dispatch_due():
+            print(f'enqueued job {job.id} {job.app.name}')
+        if once:
+            break
+        time.sleep(app.config['CRAWL_SCHEDULE_POLL_INTERVAL'])
@@ -1,5 +1,7 @@
 import re
+import json
 import time
+import threading
 import datetime
 from tqdm import tqdm
 from urllib import request
@@ -7,82 +9,63 @@ from urllib.error import HTTPError
 from urllib.parse import urljoin, urlparse
 
 import requests
-import pykakasi
-from bs4 import BeautifulSoup
-from selenium import webdriver
+from bs4 import BeautifulSoup, SoupStrainer, FeatureNotFound
 from selenium.webdriver.common.by import By
-from webdriver_manager.chrome import ChromeDriverManager
-
-from app import db
-from app.models import App, Comic, Crawl, CrawlHistory
-
-
-class RobotsTxtError(Exception):
-    """RobotsTxtのエラー"""
-    pass
-
-
-class RobotsTxt:
-    def __init__(self, url):
-        self.url = url
-        self._get_robots_txt()
-        self._parse_robots_txt()
-
-    def _get_robots_txt(self):
-        """robots.txtを取得する"""
-        res = requests.get(
-            urljoin(self.url, 'robots.txt')
-        )
-        if res.status_code != 200:
-            self.robots_txt = ""
-            return
-        self.robots_txt = res.text            
-        # コメントを除去する
-        self.robots_txt = re.sub(r'#.*\n', '', self.robots_txt)
-
-    def _parse_robots_txt(self):
-        """robots.txtを解析する"""
-        self.robots_dict = {
-            'crawl-delay': 1,
-            'disallow': [],
-            'allow': [],
-            'sitemap': [],
-            'else': []
-        }        
-        if not self.robots_txt: return
-
-        agents = self.robots_txt.split('\n\n')
-        my_agent = list(filter(lambda x: x.startswith('User-agent: *'), agents))
-        if not my_agent: return 
-        my_agent = my_agent[0]
-        for line in my_agent.split('\n')[1:]:
-            line = line.split(': ')
-            if len(line) != 2: continue
-            if line[0] == 'Crawl-delay':
-                self.robots_dict[line[0].lower()] = int(line[1])
-            elif line[0] in ['Disallow', 'Allow', 'Sitemap']:
-                self.robots_dict[line[0].lower()].append(line[1])
-            else:
-                self.robots_dict['else'].append(line)
-    
-    def apply_crawl_delay(self):
-        """クロール間隔を取得する"""
-        time.sleep(self.robots_dict['crawl-delay'])
-    
-    def check_disallow(self, url):
-        """urlがdisallowされているかを判定する"""
-        url_path = urlparse(url).path
-        if url_path == '': url_path = '/'
-        if url_path in self.robots_dict['disallow']:
-            raise RobotsTxtError(f'{url} is disallowed by robots.txt')
+from selenium.webdriver.support import expected_conditions as EC
+from selenium.webdriver.support.ui import WebDriverWait
+
+from app import app, db
+from app.models import App, Comic, Crawl, CrawlHistory, CacheVersion
+from app.browser import browser_pool
+from app.fetcher import fetch_client
+from app.kana import kana_converter
+from app.politeness import map_concurrently
+from app.robots import RobotsTxt, RobotsTxtError, robots_cache
+from app.search_index import refresh_indexes
+from app.snapshot import rebuild_snapshots
+
+
+# 各サイトで使う要素（HTML_PARSE_MODEが'fast'ならこれだけを木にする）
+PARSE_ONLY = {
+    'gangan_online': SoupStrainer("a", class_=re.compile("SearchTitle_title")),
+    'daily_series': SoupStrainer("li", class_="daily-series-item"),
+    'sunday_webry': SoupStrainer("a", class_="webry-series-item-link"),
+    'manga_bang': SoupStrainer("div", class_="js-react-on-rails-component"),
+    'manga_up': SoupStrainer("li"),
+    'shonen_jump_plus': SoupStrainer("li", class_="series-list-item"),
+    'ura_sunday_list': SoupStrainer("div", class_="title-all-list"),
+    'ura_sunday_detail': SoupStrainer("div", class_="info"),
+}
+
+# 取得は並列に行い，保存は1つずつ行う（Comicの行ロックの取り合いでデッドロックしないように）
+_save_lock = threading.Lock()
+
+
+def make_soup(markup, parse_only=None):
+    """HTML_PARSE_MODEに従ってsoupを作る
+
+    'fast'ならlxmlで（無ければhtml.parserで）parse_onlyの要素だけを解析する．
+    'full'なら従来どおりhtml.parserでページ全体を解析する．
+    """
+    if app.config['HTML_PARSE_MODE'] != 'fast':
+        return BeautifulSoup(markup, 'html.parser')
+    try:
+        return BeautifulSoup(markup, 'lxml', parse_only=parse_only)
+    except FeatureNotFound:
+        return BeautifulSoup(markup, 'html.parser', parse_only=parse_only)
 
 
 def exception(func):
-    """例外処理を行うのとstatusを記録するデコレーター"""
+    """例外処理を行うのとstatusを記録するデコレーター
+
+    失敗はすぐに記録する．成功はsave()で作品と同じトランザクションで記録する
+    （保存に失敗したクロールが成功として残らないように）．
+    """
     def wrapper(self, *args, **kwargs):
         res = {}
         try:
             func(self, *args, **kwargs)
+            self.fill_title_kana()
         except Exception as e:
             crawl_history = CrawlHistory(
                 app_id=self.app_record.id, 
@@ -96,6 +79,7 @@ def exception(func):
             if self.comics:
                 crawl_history = CrawlHistory(
                     app_id=self.app_record.id, 
+                    crawled_at=datetime.datetime.now(),
                     comics_num=len(self.comics),
                     status='success'
                 )
@@ -112,62 +96,99 @@ def exception(func):
                 res['detail'] = 'no comics'
                 status_code = 500
         finally:
-            db.session.add(crawl_history)
-            db.session.commit()
+            if crawl_history.status == 'failure':
+                db.session.add(crawl_history)
+                db.session.commit()
+            self.crawl_history = crawl_history
         return {'dict': res, 'status_code': status_code}
     return wrapper
 
 
 class ComicCrawler:
+    # アプリ名とクロールするメソッドの対応
+    CRAWL_FUNCS = {
+        'COMIC FUZ': '_crawl_comic_fuz',
+        'LINEマンガ': '_crawl_line_manga',
+        'ガンガンONLINE': '_crawl_gangan_online',
+        'コミックDAYS': '_crawl_comic_days',
+        'サンデーうぇぶり': '_crawl_sunday_webry',
+        'マガポケ': '_crawl_maga_poke',
+        'マンガBANG！': '_crawl_manga_bang',
+        'マンガUP！': '_crawl_manga_up',
+        '少年ジャンプ＋': '_crawl_shonen_jump_plus',
+        '裏サンデー': '_crawl_ura_sunday',
+        'マンガワン': '_crawl_ura_sunday',
+    }
+    # 他のアプリのクロールで一緒に保存されるアプリ
+    CRAWLED_WITH = {
+        'マンガワン': '裏サンデー',
+    }
+
     def __init__(self, app_record: App):
         self.app_record = app_record
-        if self.app_record.name == 'COMIC FUZ':
-            self.crawl_func = self._crawl_comic_fuz
-        elif self.app_record.name == 'LINEマンガ':
-            self.crawl_func = self._crawl_line_manga
-        elif self.app_record.name == 'ガンガンONLINE':
-            self.crawl_func = self._crawl_gangan_online
-        elif self.app_record.name == 'コミックDAYS':
-            self.crawl_func = self._crawl_comic_days
-        elif self.app_record.name == 'サンデーうぇぶり':
-            self.crawl_func = self._crawl_sunday_webry
-        elif self.app_record.name == 'マガポケ':
-            self.crawl_func = self._crawl_maga_poke
-        elif self.app_record.name == 'マンガBANG！':
-            self.crawl_func = self._crawl_manga_bang
-        elif self.app_record.name == 'マンガUP！':
-            self.crawl_func = self._crawl_manga_up
-        elif self.app_record.name == '少年ジャンプ＋':
-            self.crawl_func = self._crawl_shonen_jump_plus
-        elif self.app_record.name in ('裏サンデー', 'マンガワン'):
-            self.crawl_func = self._crawl_ura_sunday
-        else:
+        if self.app_record.name not in self.CRAWL_FUNCS:
             raise ValueError(f'app name is invalid {self.app_record.name}')
+        self.crawl_func = getattr(self, self.CRAWL_FUNCS[self.app_record.name])
         if self.app_record.site_url:
-            self.robots_txt = RobotsTxt(self.app_record.site_url)
+            # 同じホストのrobots.txtはプロセス内で使い回す
+            self.robots_txt = robots_cache.get(self.app_record.site_url)
         self.comics = []
-        # ルビ振り
-        kakasi = pykakasi.kakasi()
-        kakasi.setMode("J", "H")
-        kakasi.setMode("K", "H")
-        self.conv = kakasi.getConverter()
+        self.crawl_history = None
+        self.fetch_timings = []
+        # 開いたページ数（ジョブの進み具合として表示する）
+        self.pages = 0
 
 
-    def get_soup(self, url):
+    def get_soup(self, url, parse_only=None):
         """urlからsoupを取得する"""
         self.robots_txt.check_disallow(url)
-        headers = {
-            "User-Agent": "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"
-        }
-        res = requests.get(url, headers=headers)
-        soup = BeautifulSoup(res.content, 'html.parser')
-        self.robots_txt.apply_crawl_delay()
+        self.pages += 1
+        # 間隔を守ってから接続を使い回して取得する
+        res = fetch_client.get(url, key=self.robots_txt.host_key, min_delay=self.robots_txt.crawl_delay)
+        self.fetch_timings.append(res.timing)
+        soup = make_soup(res.content, parse_only)
         return soup
 
 
+    def wait_for(self, driver, css_selector):
+        """css_selectorの要素が表示されるまで待つ"""
+        WebDriverWait(driver, app.config['SELENIUM_WAIT_TIMEOUT']).until(
+            EC.presence_of_element_located((By.CSS_SELECTOR, css_selector))
+        )
+
+
+    def prepare_page(self, url):
+        """ブラウザでurlを開く直前に呼ぶ"""
+        self.robots_txt.check_disallow(url)
+        self.pages += 1
+        self.robots_txt.apply_crawl_delay()
+
+
+    def map_with_drivers(self, func, items):
+        """itemsのページをプールのブラウザで並列に開き，func(driver, item)の結果を順番に返す"""
+        return browser_pool.map(func, items, self.robots_txt.host_key, prepare=self.prepare_page)
+
+
+    def fill_title_kana(self):
+        """title_kanaが未設定の作品のふりがなをまとめて振る"""
+        titles = [comic['title'] for comic in self.comics if comic['title_kana'] is None]
+        if not titles: return
+        stats = {}
+        kana_dict = kana_converter.convert_many(titles, stats)
+        for comic in self.comics:
+            if comic['title_kana'] is None:
+                comic['title_kana'] = kana_dict[comic['title']]
+        print(f'title_kana: cache {stats["cache"]}, db {stats["db"]}, kakasi {stats["kakasi"]}')
+
+
     def crawl(self):
         print(f'crawling {self.app_record.name}...')
-        return self.crawl_func()
+        crawl_res = self.crawl_func()
+        if self.fetch_timings:
+            wait = sum(timing['wait'] for timing in self.fetch_timings)
+            elapsed = sum(timing['elapsed'] for timing in self.fetch_timings)
+            print(f'{len(self.fetch_timings)} requests, waited {wait:.1f}s, fetched {elapsed:.1f}s')
+        return crawl_res
     
 
     @exception
@@ -175,33 +196,34 @@ class ComicCrawler:
         """id:2 COMIC FUZの作品一覧を取得"""
         crawled_at = datetime.datetime.now()
         load_url = f"{self.app_record.site_url}/rensai"
-        self.robots_txt.check_disallow(load_url)
-        driver = webdriver.Chrome(ChromeDriverManager().install())
-        driver.get(load_url)
-        self.robots_txt.apply_crawl_delay()
+        with browser_pool.driver() as driver:
+            self.prepare_page(load_url)
+            driver.get(load_url)
+            self.wait_for(driver, ".Title_title__mh5OI")
 
-        # 作品一覧を取得
-        a_tags = driver.find_elements(By.CSS_SELECTOR, ".Title_title__mh5OI")
-        href_list = [a_tag.get_attribute('href') for a_tag in a_tags]
-
-        # 作品詳細ページに遷移
-        for href in tqdm(href_list):
-            self.robots_txt.check_disallow(href)
-            driver.get(href)
-            self.robots_txt.apply_crawl_delay()
+            # 作品一覧を取得
+            a_tags = driver.find_elements(By.CSS_SELECTOR, ".Title_title__mh5OI")
+            href_list = [a_tag.get_attribute('href') for a_tag in a_tags]
+
+        def load_detail(driver, href):
+            self.wait_for(driver, ".title_detail_introduction__name__Qr8HU")
             # class="title_detail_introduction__name__Qr8HU"のタイトルを取得
             title = driver.find_element(By.CSS_SELECTOR, ".title_detail_introduction__name__Qr8HU").text
             author_list = list(map(lambda x: x.text, driver.find_elements(By.CSS_SELECTOR, ".AuthorTag_author__name__IthhZ")))
+            return title, author_list
+
+        # 作品詳細ページを並列に取得
+        details = self.map_with_drivers(load_detail, href_list)
+        for href, (title, author_list) in tqdm(zip(href_list, details), total=len(href_list)):
             self.comics.append({
                 'title': title,
-                'title_kana': self.conv.do(title),
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': ' '.join(author_list),
                 'app_id': self.app_record.id,
                 'url': href,
                 'crawled_at': crawled_at,
             })
-        driver.quit()
 
 
     @exception
@@ -209,64 +231,67 @@ class ComicCrawler:
         """id:4 LINEマンガの作品一覧を取得"""
         crawled_at = datetime.datetime.now()
         load_url = urljoin(self.app_record.site_url, '/periodic/gender_ranking?gender=0')
-        self.robots_txt.check_disallow(load_url)
-        driver = webdriver.Chrome(ChromeDriverManager().install())
-        driver.get(load_url)
-        self.robots_txt.apply_crawl_delay()
-
-        pre_comic_len = 0
-        # 止まるまでスクロール
-        stop_flag = False
-        while not stop_flag:
-            # スクロールの高さを取得
-            scroll_height = driver.execute_script("return document.body.scrollHeight")
-            # スクロール
-            driver.execute_script(f"window.scrollTo(0, {scroll_height});")
-            self.robots_txt.apply_crawl_delay()
-
-            rank_div = driver.find_element(By.CSS_SELECTOR, ".MdCMN05List")
-            comic_list = rank_div.find_elements(By.CSS_SELECTOR, "a")
-            print(len(comic_list))
-
-            i = 0
-            while len(comic_list) == pre_comic_len:
+        with browser_pool.driver() as driver:
+            self.prepare_page(load_url)
+            driver.get(load_url)
+            self.wait_for(driver, ".MdCMN05List")
+
+            pre_comic_len = 0
+            # 止まるまでスクロール
+            stop_flag = False
+            while not stop_flag:
+                # スクロールの高さを取得
+                scroll_height = driver.execute_script("return document.body.scrollHeight")
+                # スクロール
+                driver.execute_script(f"window.scrollTo(0, {scroll_height});")
                 self.robots_txt.apply_crawl_delay()
+
                 rank_div = driver.find_element(By.CSS_SELECTOR, ".MdCMN05List")
                 comic_list = rank_div.find_elements(By.CSS_SELECTOR, "a")
-                print(f"stop: {i}, {len(comic_list)}")
-                if i >= 10:
-                    stop_flag = True
-                    break
-                i += 1
+                print(len(comic_list))
+
+                i = 0
+                while len(comic_list) == pre_comic_len:
+                    self.robots_txt.apply_crawl_delay()
+                    rank_div = driver.find_element(By.CSS_SELECTOR, ".MdCMN05List")
+                    comic_list = rank_div.find_elements(By.CSS_SELECTOR, "a")
+                    print(f"stop: {i}, {len(comic_list)}")
+                    if i >= 10:
+                        stop_flag = True
+                        break
+                    i += 1
             
-            pre_comic_len = len(comic_list)
+                pre_comic_len = len(comic_list)
+
 
+            href_list = [a_tag.get_attribute('href') for a_tag in comic_list]
 
-        href_list = [a_tag.get_attribute('href') for a_tag in comic_list]
-        for href in tqdm(href_list):
-            self.robots_txt.check_disallow(href)
-            driver.get(href)
-            self.robots_txt.apply_crawl_delay()
+        def load_detail(driver, href):
+            self.wait_for(driver, ".mdMNG04Dd02")
             title = driver.find_element(By.CSS_SELECTOR, ".mdMNG01Ttl").text
             author_list = driver.find_element(By.CSS_SELECTOR, ".mdMNG04Dd02").find_elements(By.CSS_SELECTOR, "a")
             author_list = list(map(lambda x: x.text.strip(), author_list))
+            return title, author_list
+
+        # 作品詳細ページを並列に取得
+        details = self.map_with_drivers(load_detail, href_list)
+        for href, (title, author_list) in tqdm(zip(href_list, details), total=len(href_list)):
             self.comics.append({
                 'title': title,
-                'title_kana': self.conv.do(title),
+                'title_kana': None,
                 'author': '',
                 'raw_author': ' '.join(author_list),
                 'app_id': self.app_record.id,
                 'url': href,
                 'crawled_at': crawled_at,
             })
-        driver.quit()
 
 
     @exception
     def _crawl_gangan_online(self):
         """id:8, ガンガンONLINEの作品一覧を取得"""
         load_url = f"{self.app_record.site_url}/search"
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['gangan_online'])
 
         # 作品一覧を取得
         datas = soup.find_all("a", class_=re.compile("SearchTitle_title"))
@@ -285,10 +310,9 @@ class ComicCrawler:
                     author_list.append(author_data)
             
             url = f"{self.app_record.site_url}{data.get('href')}"
-            title_kana = self.conv.do(title)
             self.comics.append({
                 'title': title,
-                'title_kana': title_kana,
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': raw_author,
                 'app_id': self.app_record.id,
@@ -302,7 +326,7 @@ class ComicCrawler:
         """id:9 コミックDAYSの作品一覧を取得"""
         crawled_at = datetime.datetime.now()
         load_url = urljoin(self.app_record.site_url, '/series')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['daily_series'])
         datas = soup.find_all("li", class_="daily-series-item")
         for data in datas:
             title = data.find("h4", class_="daily-series-title").text
@@ -313,7 +337,7 @@ class ComicCrawler:
             url = a_tag["href"]
             self.comics.append({
                 'title': title,
-                'title_kana': self.conv.do(title),
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -326,24 +350,23 @@ class ComicCrawler:
     def _crawl_sunday_webry(self):
         """id:12 サンデーうぇぶりの作品一覧を取得"""
         load_url = urljoin(self.app_record.site_url, '/series')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['sunday_webry'])
         datas_normal = soup.find_all("a", class_="webry-series-item-link")
         # 夜サンデー
         load_url = urljoin(self.app_record.site_url, '/series/yoru-sunday')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['sunday_webry'])
         datas_yoru = soup.find_all("a", class_="webry-series-item-link")
         
         datas = datas_normal + datas_yoru
         crawled_at = datetime.datetime.now()
         for data in datas:
             title = data.find("h4", class_="series-title").text
-            title_kana = self.conv.do(title)
             author = data.find("p", class_="author").text
             author_list = author.split('/')
             url = urljoin(self.app_record.site_url, data['href'])
             self.comics.append({
                 'title': title,
-                'title_kana': title_kana,
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -356,13 +379,12 @@ class ComicCrawler:
     def _crawl_maga_poke(self):
         """id:18, マガポケの作品一覧を取得"""
         load_url = urljoin(self.app_record.site_url, '/series')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['daily_series'])
 
         datas = soup.find_all("li", class_="daily-series-item")
         crawled_at = datetime.datetime.now()
         for data in datas:
             title = data.find("h4", class_="daily-series-title").text
-            title_kana = self.conv.do(title)
             author = data.find("h5", class_="daily-series-author").text
 
             def func(x):
@@ -373,7 +395,7 @@ class ComicCrawler:
             url = data.find("a")["href"]
             self.comics.append({
                 'title': title,
-                'title_kana': title_kana,
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -388,17 +410,17 @@ class ComicCrawler:
         i = 1
         while True:
             load_url = urljoin(self.app_record.site_url, f'/freemium/book_titles?page={i}')
-            soup = self.get_soup(load_url)
+            soup = self.get_soup(load_url, PARSE_ONLY['manga_bang'])
 
             datas = soup.find("div", class_="js-react-on-rails-component")["data-props"]
-            datas = eval(datas)["list"]["book_titles"]
+            datas = json.loads(datas)["list"]["book_titles"]
             if not datas: break
             print(f'load {load_url}')
             crawled_at = datetime.datetime.now()
             for data in datas:
                 self.comics.append({
                     'title': data["title"],
-                    'title_kana': self.conv.do(data["title"]),
+                    'title_kana': None,
                     'author': '',
                     'raw_author': data["author_name"],
                     'app_id': self.app_record.id,
@@ -412,7 +434,7 @@ class ComicCrawler:
     def _crawl_manga_up(self):
         """id:26 マンガUP！の作品一覧を取得"""
         load_url = urljoin(self.app_record.site_url, 'original')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['manga_up'])
 
         datas = soup.find_all("li")
         crawled_at = datetime.datetime.now()
@@ -420,7 +442,6 @@ class ComicCrawler:
             if data.find("p", class_="ttl") is None: continue
             # print(data)
             title = data.find("p", class_="ttl").text
-            title_kana = self.conv.do(title)
             author = data.find("p", class_="artist").text
             # 任意のタブ<>で正規表現を使って区切る
             author_list = re.split(r'<.+?>', str(author))[1:-1]
@@ -431,7 +452,7 @@ class ComicCrawler:
             url = urljoin(load_url + '/', data.find("a")['href'])
             self.comics.append({
                 'title': title,
-                'title_kana': title_kana,
+                'title_kana': None,
                 'author': ','.join(new_author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -444,24 +465,23 @@ class ComicCrawler:
     def _crawl_shonen_jump_plus(self):
         """id:35 少年ジャンプ＋の作品一覧を取得"""
         load_url = urljoin(self.app_record.site_url, '/series')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['shonen_jump_plus'])
         datas_1 = soup.find_all("li", class_="series-list-item")
 
         load_url = urljoin(self.app_record.site_url, '/series/finished')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['shonen_jump_plus'])
         datas_2 = soup.find_all("li", class_="series-list-item")
 
         datas = datas_1 + datas_2
         crawled_at = datetime.datetime.now()
         for data in datas:
             title = data.find("h2", class_="series-list-title").text
-            title_kana = self.conv.do(title)
             author = data.find("h3", class_="series-list-author").text
             author_list = author.split('/')
             url = data.find("a")["href"]
             self.comics.append({
                 'title': title,
-                'title_kana': title_kana,
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -477,22 +497,25 @@ class ComicCrawler:
         # 連載中作品
         print("連載中作品:")
         load_url = urljoin(self.app_record.site_url, '/serial_title')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['ura_sunday_list'])
         datas = soup.find("div", class_="title-all-list").find_all("li")
-        for data in tqdm(datas):
-            if not data.find("a"): continue
-            href = data.find("a")["href"]
-            url = urljoin(self.app_record.site_url, href)
-            soup_comic = self.get_soup(url)
+        urls = [urljoin(self.app_record.site_url, data.find("a")["href"]) for data in datas if data.find("a")]
 
+        def load_detail(url):
+            soup_comic = self.get_soup(url, PARSE_ONLY['ura_sunday_detail'])
             info = soup_comic.find("div", class_="info")
             title = info.find("h1").text.strip()
             author = info.find("div", class_="author").text.strip()
+            return title, author
+
+        # 作品詳細ページを並列に取得
+        details = map_concurrently(load_detail, urls, self.robots_txt.host_key)
+        for url, (title, author) in tqdm(zip(urls, details), total=len(urls)):
             author_list = list(map(lambda x: re.split(r'[:：]', x)[-1].strip(), author.split('\u3000')))
             author_list = list(filter(bool, author_list))
             self.comics.append({
                 'title': title,
-                'title_kana': self.conv.do(title),
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -503,7 +526,7 @@ class ComicCrawler:
 
         # 完結作品
         load_url = urljoin(self.app_record.site_url, '/complete_title')
-        soup = self.get_soup(load_url)
+        soup = self.get_soup(load_url, PARSE_ONLY['ura_sunday_list'])
 
         datas = soup.find("div", class_="title-all-list").find_all("li")
         for data in datas:
@@ -515,7 +538,7 @@ class ComicCrawler:
             url = data.find("a")["href"]
             self.comics.append({
                 'title': title,
-                'title_kana': self.conv.do(title),
+                'title_kana': None,
                 'author': ','.join(author_list),
                 'raw_author': author,
                 'app_id': self.app_record.id,
@@ -524,6 +547,7 @@ class ComicCrawler:
             })
         
         # app_idをマンガワンに変更したものを追加
+        self.fill_title_kana()
         app_record = App.query.filter_by(name='マンガワン').first()
         crawler = ComicCrawler(app_record)
         for comic in self.comics:
@@ -534,14 +558,46 @@ class ComicCrawler:
 
 
     def save(self):
-        # 同じアプリのcomicは削除
-        delete_query = Crawl.query.filter_by(app_id=self.app_record.id)
-        print(f'deleted App {self.app_record.name} {delete_query.count()} comics')
-        delete_query.delete()
-        db.session.commit()
-
-        print(f'adding {len(self.comics)} comics')
-        for comic in tqdm(self.comics):
-            Crawl.add_crawl(comic)
+        """クロール結果を保存する（全体で1トランザクション）
+
+        CRAWL_SAVE_MODEが'diff'なら(app_id, url)の差分だけを書き込み，
+        'replace'なら同じアプリのCrawlを全て削除して入れ直す．
+        同じプロセスの他の保存が終わるまで待つ．
+        成功のCrawlHistoryは作品と一緒にコミットし，保存に失敗したら失敗を記録する．
+        """
+        with _save_lock:
+            try:
+                if app.config['CRAWL_SAVE_MODE'] == 'diff':
+                    counts = Crawl.sync_crawls(self.app_record.id, self.comics)
+                    print(f'App {self.app_record.name} added {counts["added"]}, removed {counts["removed"]}, unchanged {counts["unchanged"]}')
+                    if self.crawl_history is not None:
+                        self.crawl_history.added_num = counts['added']
+                        self.crawl_history.removed_num = counts['removed']
+                        self.crawl_history.unchanged_num = counts['unchanged']
+                else:
+                    deleted_num = Crawl.query.filter_by(app_id=self.app_record.id).delete()
+                    print(f'deleted App {self.app_record.name} {deleted_num} comics')
+
+                    print(f'adding {len(self.comics)} comics')
+                    new_comics_num = Crawl.bulk_add_crawls(self.comics)
+                    print(f'{new_comics_num} new comics')
+                if self.crawl_history is not None:
+                    db.session.add(self.crawl_history)
+                CacheVersion.bump('catalog')
+                db.session.commit()
+            except Exception as e:
+                db.session.rollback()
+                if self.crawl_history is not None:
+                    self.crawl_history = CrawlHistory(
+                        app_id=self.app_record.id,
+                        status='failure',
+                        detail=f'save failed: {e}'[:1000]
+                    )
+                    db.session.add(self.crawl_history)
+                    db.session.commit()
+                raise
         print(f'done')
-        self.comics = []
\ No newline at end of file
+        self.comics = []
+        # このプロセスで作ってある検索インデックスとスナップショットだけを先に作り直しておく
+        refresh_indexes()
+        rebuild_snapshots()
\ No newline at end of file
@@ -0,0 +1,59 @@
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from app import app
+from app.politeness import host_scheduler
+
+
+USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/92.0.4515.131 Safari/537.36"
+
+
+class FetchClient:
+    """接続を使い回し，429/5xxは間隔を空けて再試行するHTTPクライアント
+
+    keyとmin_delayを渡すとHostSchedulerで間隔を守ってから送り，
+    応答時間を記録して次の間隔に反映する．
+    """
+    def __init__(self):
+        self.session = requests.Session()
+        self.session.headers['User-Agent'] = USER_AGENT
+        retry = Retry(
+            total=app.config['FETCH_RETRIES'],
+            backoff_factor=app.config['FETCH_BACKOFF_FACTOR'],
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=('GET', 'HEAD'),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(
+            pool_connections=app.config['FETCH_POOL_SIZE'],
+            pool_maxsize=app.config['FETCH_POOL_SIZE'],
+            max_retries=retry,
+        )
+        self.session.mount('http://', adapter)
+        self.session.mount('https://', adapter)
+
+    def get(self, url, key=None, min_delay=None, **kwargs):
+        """GETする．レスポンスのtimingに待ち時間と通信時間を入れて返す"""
+        waited = 0
+        if key is not None:
+            waited = host_scheduler.wait(key, min_delay or 0)
+        kwargs.setdefault('timeout', app.config['FETCH_TIMEOUT'])
+        start = time.perf_counter()
+        res = self.session.get(url, **kwargs)
+        elapsed = time.perf_counter() - start
+        if key is not None:
+            host_scheduler.record(key, elapsed, res.status_code)
+        res.timing = {
+            'url': url,
+            'status_code': res.status_code,
+            'wait': waited,
+            'elapsed': elapsed,
+        }
+        return res
+
+
+fetch_client = FetchClient()
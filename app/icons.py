@@ -0,0 +1,195 @@
+import io
+import os
+import hashlib
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+from selenium.webdriver.common.by import By
+
+from app import app
+from app.browser import browser_pool
+from app.fetcher import fetch_client
+from app.robots import RobotsTxtError, robots_cache
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:
+    Image = None
+
+
+ICON_DIR = os.path.join('app', 'static', 'images', 'app')
+
+# スレッドに渡すアプリの情報（セッションに紐づくApp自体は渡さない）
+IconTask = namedtuple('IconTask', [
+    'id', 'name', 'platform_type', 'app_store_url', 'site_url',
+    'img_hash', 'img_source_url', 'img_etag', 'img_last_modified',
+])
+IconResult = namedtuple('IconResult', ['task', 'img_hash', 'source_url', 'etag', 'last_modified', 'content', 'error'])
+
+
+def icon_path(app_id):
+    return os.path.join(ICON_DIR, f'{app_id}.png')
+
+
+def icon_url(app_id):
+    return f'/static/images/app/{app_id}.png'
+
+
+def polite_get(url, **kwargs):
+    """ホストのCrawl-delayをクローラーと共有のHostSchedulerで守ってGETする
+
+    robots.txtでdisallowされているURLはRobotsTxtErrorにして取得しない．
+    """
+    robots_txt = robots_cache.get(url)
+    robots_txt.check_disallow(url)
+    return fetch_client.get(url, key=robots_txt.host_key, min_delay=robots_txt.crawl_delay, **kwargs)
+
+
+def largest_src(srcset):
+    """srcsetの最後（一番大きい）候補のURL"""
+    return srcset.split(',')[-1].strip().split(' ')[0]
+
+
+def find_app_store_icon_url(load_url):
+    """App Storeのページからアイコンの画像のURLを探す
+
+    最初のclass="we-artwork__image"の画像がアイコン．
+    静的なHTMLの<picture>のsrcsetから取り，無ければブラウザで開いて取る．
+    """
+    res = polite_get(load_url)
+    soup = BeautifulSoup(res.content, 'html.parser', parse_only=SoupStrainer('picture'))
+    for picture in soup.find_all('picture'):
+        if not picture.find('img', class_='we-artwork__image'):
+            continue
+        sources = picture.find_all('source', srcset=True)
+        png = [source for source in sources if source.get('type') == 'image/png']
+        if png or sources:
+            return urljoin(load_url, largest_src((png or sources)[0]['srcset']))
+        break
+
+    with browser_pool.driver() as driver:
+        robots_txt = robots_cache.get(load_url)
+        robots_txt.check_disallow(load_url)
+        robots_txt.apply_crawl_delay()
+        driver.get(load_url)
+        # class="we-artwork__image"のimgタグのsrcを取得
+        img_tag = driver.find_element(By.CSS_SELECTOR, ".we-artwork__image")
+        return img_tag.get_attribute('currentSrc')
+
+
+def find_site_icon_url(load_url):
+    """サイトのrel='icon'のlinkタグのhrefを取得する"""
+    res = polite_get(load_url)
+    soup = BeautifulSoup(res.content, 'html.parser', parse_only=SoupStrainer('link'))
+    link_tag = soup.find(rel="icon")
+    img_url = link_tag.get('href')
+    if img_url.startswith('//'):
+        return f'https:{img_url}'
+    return urljoin(load_url, img_url)
+
+
+def find_icon_url(task):
+    if task.platform_type in ('app', 'both'):
+        return find_app_store_icon_url(task.app_store_url)
+    if 'web' in task.platform_type:
+        return find_site_icon_url(task.site_url)
+    raise ValueError(f'platform_type is invalid {task.platform_type}')
+
+
+def normalize_icon(content):
+    """ICON_SIZE四方の透過PNGにする（Pillowが無いか読めない画像ならそのまま）"""
+    if Image is None:
+        return content
+    size = app.config['ICON_SIZE']
+    try:
+        with Image.open(io.BytesIO(content)) as img:
+            img = ImageOps.contain(img.convert('RGBA'), (size, size), Image.LANCZOS)
+    except Exception:
+        return content
+    canvas = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    canvas.paste(img, ((size - img.width) // 2, (size - img.height) // 2))
+    buf = io.BytesIO()
+    canvas.save(buf, format='PNG', optimize=True)
+    return buf.getvalue()
+
+
+def fetch_icon(task):
+    """アイコンをダウンロードする．前回と同じ画像ならcontentはNone
+
+    前回と同じURLの画像で保存したファイルがあれば，前回のETagとLast-Modifiedで
+    条件付きGETにして，変わっていなければ（304）ダウンロードしない．
+    """
+    try:
+        source_url = find_icon_url(task)
+        headers = {}
+        if source_url == task.img_source_url and os.path.exists(icon_path(task.id)):
+            if task.img_etag:
+                headers['If-None-Match'] = task.img_etag
+            if task.img_last_modified:
+                headers['If-Modified-Since'] = task.img_last_modified
+        res = polite_get(source_url, headers=headers)
+        if res.status_code == 304:
+            return IconResult(task, task.img_hash, source_url, task.img_etag, task.img_last_modified, None, None)
+        res.raise_for_status()
+        etag, last_modified = res.headers.get('ETag'), res.headers.get('Last-Modified')
+        img_hash = hashlib.sha256(res.content).hexdigest()
+        if img_hash == task.img_hash and os.path.exists(icon_path(task.id)):
+            return IconResult(task, img_hash, source_url, etag, last_modified, None, None)
+        return IconResult(task, img_hash, source_url, etag, last_modified, normalize_icon(res.content), None)
+    except Exception as e:
+        return IconResult(task, None, None, None, None, None, e)
+
+
+def sync_icons(app_records, refresh=False):
+    """アイコンの無いアプリのアイコンを並列に取得して保存する
+
+    画像ファイルが既にあればそれを使う．refreshならimg_urlがあっても取得し直すが，
+    元画像が前回と同じURLで変わっていなければ（条件付きGETで304）ダウンロードせず，
+    ダウンロードしても元画像のハッシュ（App.img_hash）が同じなら保存し直さない．
+    リクエストはホストごとにクローラーと同じ間隔を守り，robots.txtでdisallowされている
+    ページと画像は取得せずに飛ばす（disallowedとして数える）．
+    アプリの更新とキャッシュのバージョンの更新，コミットは呼び出し側で行う．
+    """
+    counts = {'existing': 0, 'fetched': 0, 'unchanged': 0, 'disallowed': 0, 'failed': 0}
+    records = {}
+    tasks = []
+    for app_record in app_records:
+        if app_record.img_url and not refresh:
+            continue
+        if not refresh and os.path.exists(icon_path(app_record.id)):
+            app_record.img_url = icon_url(app_record.id)
+            counts['existing'] += 1
+            continue
+        records[app_record.id] = app_record
+        tasks.append(IconTask(app_record.id, app_record.name, app_record.platform_type,
+                              app_record.app_store_url, app_record.site_url, app_record.img_hash,
+                              app_record.img_source_url, app_record.img_etag, app_record.img_last_modified))
+
+    if tasks:
+        os.makedirs(ICON_DIR, exist_ok=True)
+        with ThreadPoolExecutor(max_workers=app.config['ICON_WORKERS']) as executor:
+            for result in executor.map(fetch_icon, tasks):
+                app_record = records[result.task.id]
+                if isinstance(result.error, RobotsTxtError):
+                    print(f'skipped {result.task.name}: {result.error}')
+                    counts['disallowed'] += 1
+                    continue
+                if result.error is not None:
+                    print(f'failed to get image_url {result.task.name}')
+                    print(result.error)
+                    counts['failed'] += 1
+                    continue
+                if result.content is None:
+                    counts['unchanged'] += 1
+                else:
+                    with open(icon_path(app_record.id), 'wb') as f:
+                        f.write(result.content)
+                    counts['fetched'] += 1
+                app_record.img_hash = result.img_hash
+                app_record.img_source_url = result.source_url
+                app_record.img_etag = result.etag
+                app_record.img_last_modified = result.last_modified
+                app_record.img_url = icon_url(app_record.id)
+    return counts
@@ -0,0 +1,122 @@
+import threading
+from collections import OrderedDict
+
+import pykakasi
+
+from app import app, db
+from app.models import Comic
+
+
+class KanaConverter:
+    """タイトルをひらがなに変換する（結果を覚えておく）
+
+    変換はまずメモリ上のLRUを引き，無ければ保存済みのComicのtitle_kanaを
+    まとめて引き，それでも無いタイトルだけpykakasiで変換する．
+    保存済みのComicに同じタイトルがあれば，新しく変換しても保存されるのは
+    既存のtitle_kanaなので，結果は毎回変換するのと変わらない．
+    pykakasiの辞書の読み込みは重いので，プロセスで1回だけ行う．
+    """
+    def __init__(self, maxsize=None, chunk_size=500):
+        self._lock = threading.Lock()
+        self._kakasi_lock = threading.Lock()
+        self._conv = None
+        self._cache = OrderedDict()
+        self.maxsize = maxsize
+        self.chunk_size = chunk_size
+        self.stats = {'cache': 0, 'db': 0, 'kakasi': 0}
+
+    def _converter(self):
+        if self._conv is None:
+            kakasi = pykakasi.kakasi()
+            kakasi.setMode("J", "H")
+            kakasi.setMode("K", "H")
+            self._conv = kakasi.getConverter()
+        return self._conv
+
+    def _get(self, text):
+        with self._lock:
+            kana = self._cache.get(text)
+            if kana is not None:
+                self._cache.move_to_end(text)
+            return kana
+
+    def _put(self, text, kana):
+        maxsize = self.maxsize or app.config['KANA_CACHE_SIZE']
+        with self._lock:
+            self._cache[text] = kana
+            self._cache.move_to_end(text)
+            while len(self._cache) > maxsize:
+                self._cache.popitem(last=False)
+
+    def _load_stored(self, texts):
+        """保存済みのComicからタイトル（前後の空白を除く）→title_kanaの辞書を作る"""
+        titles = list({text.strip() for text in texts})
+        stored = {}
+        for i in range(0, len(titles), self.chunk_size):
+            rows = db.session.query(Comic.title, Comic.title_kana) \
+                .filter(Comic.title.in_(titles[i:i + self.chunk_size])).all()
+            stored.update((title, title_kana) for title, title_kana in rows if title_kana)
+        return stored
+
+    def do(self, text):
+        """pykakasiのConverter.do()と同じように1件変換する"""
+        return self.convert_many([text])[text]
+
+    def convert_many(self, texts, stats=None):
+        """まとめて変換し，テキスト→ひらがなの辞書を返す
+
+        statsに辞書を渡すと，どこから得た結果かの件数をそこにも足す．
+        """
+        result = {}
+        missing = []
+        for text in dict.fromkeys(texts):
+            kana = self._get(text)
+            if kana is None:
+                missing.append(text)
+            else:
+                result[text] = kana
+        counts = {'cache': len(result), 'db': 0, 'kakasi': 0}
+        if missing:
+            stored = self._load_stored(missing)
+            with self._kakasi_lock:
+                for text in missing:
+                    kana = stored.get(text.strip())
+                    if kana is None:
+                        kana = self._converter().do(text)
+                        counts['kakasi'] += 1
+                    else:
+                        counts['db'] += 1
+                    result[text] = kana
+                    self._put(text, kana)
+        with self._lock:
+            for key, count in counts.items():
+                self.stats[key] += count
+        if stats is not None:
+            for key, count in counts.items():
+                stats[key] = stats.get(key, 0) + count
+        return result
+
+    def clear(self):
+        with self._lock:
+            self._cache.clear()
+
+
+kana_converter = KanaConverter()
+
+
+_romaji_lock = threading.Lock()
+_romaji_conv = None
+
+
+def to_romaji(texts):
+    """かなをヘボン式のローマ字にしたリストを返す（変換器はプロセスで1つだけ作る）"""
+    global _romaji_conv
+    with _romaji_lock:
+        if _romaji_conv is None:
+            kakasi = pykakasi.kakasi()
+            kakasi.setMode("H", "a")
+            kakasi.setMode("K", "a")
+            kakasi.setMode("J", "a")
+            kakasi.setMode("r", "Hepburn")
+            _romaji_conv = kakasi.getConverter()
+        return [_romaji_conv.do(text) if text else '' for text in texts]
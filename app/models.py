@@ -1,17 +1,26 @@
-import os
 import csv
-import time
 import datetime
-from urllib.parse import urljoin
+from collections import defaultdict
 
-import requests
-from bs4 import BeautifulSoup
-from selenium import webdriver
-from selenium.webdriver.common.by import By
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import Enum
+from sqlalchemy import Enum, insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
 from app import app, db
+from app.icons import sync_icons
+from app.politeness import politeness_key
+from app.search_key import make_search_key
+
+
+def insert_ignoring_duplicates(model, index_elements):
+    """ユニークキー（index_elements）が既存の行と重複する行は飛ばすINSERT文"""
+    if db.session.get_bind().dialect.name == 'mysql':
+        statement = mysql_insert(model)
+        # 何も変えない更新にして重複を無視する（INSERT IGNOREは他のエラーも無視してしまう）
+        return statement.on_duplicate_key_update(id=statement.table.c.id)
+    return sqlite_insert(model).on_conflict_do_nothing(index_elements=index_elements)
 
 
 class App(db.Model):
@@ -27,6 +36,12 @@ class App(db.Model):
     google_play_url = db.Column(db.String(500))
     site_url = db.Column(db.String(500))
     crawl_status = db.Column(db.String(30))
+    # 取得したアイコンの元画像のsha256
+    img_hash = db.Column(db.String(64))
+    # アイコンの元画像のURLとそのETag, Last-Modified（取得し直すときの条件付きGETに使う）
+    img_source_url = db.Column(db.String(500))
+    img_etag = db.Column(db.String(255))
+    img_last_modified = db.Column(db.String(64))
     crawl_histories = db.relationship('CrawlHistory', backref='crawl', lazy='dynamic')
 
     def __repr__(self):
@@ -34,98 +49,110 @@ class App(db.Model):
     
     @staticmethod
     def update_image_url(app_record):
-        res_record = app_record
-        if app_record.img_url:
-            return res_record
+        """1つのアプリのアイコンを取得する（まとめて取得するならsync_iconsを使う）"""
+        img_url = app_record.img_url
+        sync_icons([app_record])
+        if app_record.img_url != img_url:
+            CacheVersion.bump('app')
+        return app_record
 
-        if os.path.exists(f'app/static/images/app/{app_record.id}.png'):
-            res_record.img_url = f'/static/images/app/{app_record.id}.png'
-            return res_record
+    @staticmethod
+    def update():
+        """app_info.csvをAppテーブルに反映してから，アイコンを取得する"""
+        App.sync_from_csv()
+        App.update_icons()
 
-        try:
-            if app_record.platform_type in ('app', 'both'):
-                load_url = app_record.app_store_url
-                driver = webdriver.Chrome()
-                driver.get(load_url)
-
-                # class="we-artwork__image"のimgタグのsrcを取得
-                img_tag = driver.find_element(By.CSS_SELECTOR, ".we-artwork__image")
-                img_url = img_tag.get_attribute('currentSrc')
-                driver.quit()
-                time.sleep(1)
-                # ダウンロードして保存
-                img = requests.get(img_url)
-                file_name = f'app/static/images/app/{app_record.id}.png'
-                with open(file_name, 'wb') as f:
-                    f.write(img.content)
-                res_record.img_url = file_name[file_name.find('/'):]
-                return res_record
-            
-            if 'web' in app_record.platform_type:
-                load_url = app_record.site_url
-                html = requests.get(load_url)
-                soup = BeautifulSoup(html.content, "html.parser")
-
-                # rel='icon'のlinkタグのhrefを取得
-                link_tag = soup.find(rel="icon")
-                img_url = link_tag.get('href')
-                if img_url.startswith('//'):
-                    img_url = f'https:{img_url}'
-                elif 'http' != img_url[:4]:
-                    img_url = urljoin(load_url, img_url)
-                # ダウンロードして保存
-                img = requests.get(img_url)
-                file_name = f'app/static/images/app/{app_record.id}.png'
-                with open(file_name, 'wb') as f:
-                    f.write(img.content)
-                res_record.img_url = file_name[file_name.find('/'):]
-                return res_record
-            
-            print(f'platform_type is invalid {app_record.platform_type}')
-            return res_record
-            
-        except Exception as e:
-            print('failed to get image_url')
-            print(e)
-            return res_record
+    # app_info.csvから反映する列（CSVに無い列は変更しない）
+    CSV_FIELDS = (
+        'name', 'img_url', 'platform_type', 'app_store_url', 'google_play_url', 'site_url',
+        'abj_management_number', 'company_name', 'service_type', 'crawl_status',
+    )
 
     @staticmethod
-    def update():
-        with open(app.config['APP_CSV_PATH'], encoding="utf-8") as f:
+    def sync_from_csv(csv_path=None):
+        """app_info.csvとAppテーブルの差分だけを1トランザクションでまとめて反映する
+
+        CSVとAppテーブルをそれぞれ1回だけ読み，列ごとに比べて追加と更新を
+        まとめて実行する．空欄はNULLとして比べる．img_urlはアイコンの取得で
+        埋まるので，CSVに書かれているときだけ反映する．CSVに無いアプリは消さない．
+        アイコンの取得はしない（update_icons()で別に行う）．
+        """
+        with open(csv_path or app.config['APP_CSV_PATH'], encoding="utf-8") as f:
             reader = csv.DictReader(f)
-            for row in reader:
-                if App.query.filter_by(id=row['id']).first():
-                    app_record = App.query.filter_by(id=row['id']).first()
-                    print(f'update {app_record.name}')
-                    app_record.name = row['name']
-                    app_record.img_url = row['img_url']
-                    app_record.platform_type = row['platform_type']
-                    app_record.app_store_url = row['app_store_url']
-                    app_record.google_play_url = row['google_play_url']
-                    app_record.site_url = row['site_url']
-                    app_record.abj_management_number = row['abj_management_number']
-                    app_record.company_name = row['company_name']
-                    app_record.service_type = row['service_type']
-                    app_record.crawl_status = row['crawl_status']
-                    app_record = App.update_image_url(app_record)
-                else:
-                    app_record = App(**row)
-                    print(f'add {app_record.name}')
-                    app_record = App.update_image_url(app_record)
-                    db.session.add(app_record)
-                print(app_record.platform_type)
-                db.session.commit()
-                print(f'done')
+            fields = [field for field in App.CSV_FIELDS if field in reader.fieldnames]
+            csv_rows = {int(row['id']): row for row in reader}
+        current = {app_record.id: app_record for app_record in App.query.all()}
+
+        new_rows, updates, changes = [], [], []
+        for app_id, row in csv_rows.items():
+            values = {field: row.get(field) or None for field in fields}
+            app_record = current.get(app_id)
+            if app_record is None:
+                values['img_url'] = values.get('img_url') or ''
+                new_rows.append(dict(values, id=app_id))
+                continue
+            if not values.get('img_url'):
+                values.pop('img_url', None)
+            diff = {field: value for field, value in values.items() if (getattr(app_record, field) or None) != value}
+            if diff:
+                updates.append(dict(diff, id=app_id))
+                # コミットすると読み直されるので変更前の値を控えておく
+                changes += [(app_id, app_record.name, field, getattr(app_record, field), value) for field, value in diff.items()]
+        missing = sorted(set(current) - set(csv_rows))
+
+        try:
+            if new_rows:
+                db.session.execute(insert(App), new_rows)
+            if updates:
+                db.session.bulk_update_mappings(App, updates)
+            if new_rows or updates:
+                CacheVersion.bump('app')
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+
+        for row in new_rows:
+            print(f'add {row["id"]} {row["name"]}')
+        for app_id, name, field, old_value, value in changes:
+            print(f'update {app_id} {name} {field}: {old_value!r} -> {value!r}')
+        for app_id in missing:
+            print(f'not in csv {app_id}')
+        summary = {
+            'added': len(new_rows),
+            'updated': len(updates),
+            'unchanged': len(csv_rows) - len(new_rows) - len(updates),
+            'not_in_csv': len(missing),
+        }
+        print(', '.join(f'{key} {value}' for key, value in summary.items()))
+        return summary
+
+    @staticmethod
+    def update_icons(refresh=False):
+        """アイコンの無いアプリのアイコンをまとめて取得する（img_urlが変わったときだけキャッシュを更新する）"""
+        app_records = App.query.order_by(App.id).all()
+        img_urls = {app_record.id: app_record.img_url for app_record in app_records}
+        counts = sync_icons(app_records, refresh=refresh)
+        if any(app_record.img_url != img_urls[app_record.id] for app_record in app_records):
+            CacheVersion.bump('app')
+        db.session.commit()
+        print('icons: ' + ', '.join(f'{key} {value}' for key, value in counts.items()))
+        return counts
 
 
 class Comic(db.Model):
     __tablename__ = 'comic'
     id = db.Column(db.Integer, primary_key=True)
-    title = db.Column(db.String(255), nullable=False)
-    title_kana = db.Column(db.String(255), nullable=False)
+    # add_comicとbulk_get_idsのタイトルでの検索，title_kana順のページングのためのインデックス．
+    # 並行した保存で同じタイトルのComicが2つできないようにtitleはユニークにする
+    title = db.Column(db.String(255), nullable=False, index=True, unique=True)
+    title_kana = db.Column(db.String(255), nullable=False, index=True)
     author = db.Column(db.String(255))
     raw_author = db.Column(db.String(255))
-    crawls = db.relationship('Crawl', backref='comic', lazy='joined')
+    # キーワード検索用にtitle, title_kana, raw_authorを正規化したもの（app.search_key）
+    search_key = db.Column(db.Text)
+    # 一覧のAPIはapp.comic_rowsで列だけを読むので，ComicのクエリにはCrawlをJOINしない
+    crawls = db.relationship('Crawl', backref='comic', lazy='select', order_by='Crawl.id')
 
     def __repr__(self):
         return f'<Comic {self.id} {self.title}>'
@@ -140,17 +167,128 @@ class Comic(db.Model):
                 comic_query.author = comic_data.author
                 db.session.commit()
             return comic_query.id
-        else:
-            db.session.add(comic_data)
+        try:
+            with db.session.begin_nested():
+                db.session.add(comic_data)
+        except IntegrityError:
+            # 他の保存が同じタイトルを先に追加した
+            comic_id = Comic.locked_id(comic_data.title)
+            db.session.commit()
+            return comic_id
+        db.session.commit()
+        return comic_data.id
+
+    @staticmethod
+    def locked_id(title):
+        """titleのComicのidを共有ロック付きで読む
+
+        MySQLの通常のSELECTはトランザクションの開始時点のスナップショットを読むので，
+        他のトランザクションが後から追加した行はロック付きで読まないと見えない．
+        """
+        return db.session.query(Comic.id).filter(Comic.title == title).with_for_update(read=True).scalar()
+
+    @staticmethod
+    def bulk_get_ids(crawl_datas, chunk_size=500):
+        """タイトルからComicのidの辞書を作る．無いComicはまとめて追加する
+
+        add_comicを1件ずつ呼ぶのと同じ結果になるように，タイトルごとに
+        最初に見つかったデータでComicを作り，authorが空なら後のデータで埋める．
+        """
+        comic_datas = {}
+        for crawl_data in crawl_datas:
+            title = crawl_data['title'].strip()
+            comic_data = comic_datas.get(title)
+            if comic_data is None:
+                comic_datas[title] = comic_data = {
+                    'title': title,
+                    'title_kana': crawl_data['title_kana'].strip(),
+                    'author': crawl_data['author'],
+                    'raw_author': crawl_data['raw_author'].strip(),
+                }
+                comic_data['search_key'] = make_search_key(title, comic_data['title_kana'], comic_data['raw_author'])
+            elif not comic_data['author'] and crawl_data['author']:
+                comic_data['author'] = crawl_data['author']
+        titles = list(comic_datas)
+
+        def fetch_comics(target_titles, lock=False):
+            rows = []
+            for i in range(0, len(target_titles), chunk_size):
+                query = db.session.query(Comic.id, Comic.title, Comic.author).filter(
+                    Comic.title.in_(target_titles[i:i + chunk_size])
+                )
+                if lock:
+                    query = query.with_for_update(read=True)
+                rows.extend(query.all())
+            return rows
+
+        # 既存のComicを1回のクエリ（チャンクごと）で取得
+        comic_ids = {}
+        author_updates = []
+        for comic_id, title, author in fetch_comics(titles):
+            if title not in comic_datas:
+                continue
+            comic_ids[title] = comic_id
+            if not author and comic_datas[title]['author']:
+                author_updates.append((title, {'id': comic_id, 'author': comic_datas[title]['author']}))
+        # 並行した保存とデッドロックしないように，行のロックはタイトル順に取る
+        if author_updates:
+            author_updates.sort(key=lambda update: update[0])
+            db.session.bulk_update_mappings(Comic, [mapping for _, mapping in author_updates])
+
+        # 新しいComicをまとめて追加してidを取り直す．並行した保存が同じタイトルを
+        # 先に追加していたら，その行は追加せずに（ロック付きで読んだ）その行のidを使う
+        new_titles = sorted(title for title in titles if title not in comic_ids)
+        if new_titles:
+            db.session.execute(insert_ignoring_duplicates(Comic, ['title']), [comic_datas[title] for title in new_titles])
+            for comic_id, title, _ in fetch_comics(new_titles, lock=True):
+                comic_ids.setdefault(title, comic_id)
+            # DBの照合順序で既存のタイトルと同じとみなされたもの（大文字と小文字の違いなど）
+            for title in new_titles:
+                if title not in comic_ids:
+                    comic_ids[title] = Comic.locked_id(title)
+        return comic_ids, len(new_titles)
+
+    @staticmethod
+    def backfill_search_keys(refresh=False, chunk_size=1000):
+        """search_keyの無いComic（refreshなら全てのComic）のsearch_keyを埋める
+
+        idの順にchunk_size件ずつ読んで更新し，チャンクごとにコミットする．更新した件数を返す．
+        更新したチャンクでは'catalog'と'search_key'のバージョンを上げ，検索インデックスに反映させる．
+        """
+        updated = 0
+        last_id = 0
+        while True:
+            query = db.session.query(Comic.id, Comic.title, Comic.title_kana, Comic.raw_author, Comic.search_key).filter(
+                Comic.id > last_id
+            )
+            if not refresh:
+                query = query.filter(Comic.search_key.is_(None))
+            rows = query.order_by(Comic.id).limit(chunk_size).all()
+            if not rows:
+                break
+            last_id = rows[-1].id
+            mappings = []
+            for row in rows:
+                search_key = make_search_key(row.title, row.title_kana, row.raw_author)
+                if search_key != row.search_key:
+                    mappings.append({'id': row.id, 'search_key': search_key})
+            if mappings:
+                db.session.bulk_update_mappings(Comic, mappings)
+                CacheVersion.bump('catalog')
+                CacheVersion.bump('search_key')
             db.session.commit()
-            return comic_data.id
+            updated += len(mappings)
+            print(f'search_key: {updated} updated (id <= {last_id})')
+        return updated
 
 
 class Crawl(db.Model):
     __tablename__ = 'crawl'
+    # sync_crawlsは(app_id, url)をキーにするので，同じアプリの同じurlは1行だけにする
+    __table_args__ = (db.Index('ix_crawl_app_id_url', 'app_id', 'url', unique=True),)
     id = db.Column(db.Integer, primary_key=True)
-    comic_id = db.Column(db.Integer, db.ForeignKey('comic.id'), nullable=False)
-    app_id = db.Column(db.Integer, db.ForeignKey('app.id'), nullable=False)
+    comic_id = db.Column(db.Integer, db.ForeignKey('comic.id'), nullable=False, index=True)
+    app_id = db.Column(db.Integer, db.ForeignKey('app.id'), nullable=False, index=True)
     url = db.Column(db.String(255), nullable=False)
     crawled_at = db.Column(db.DateTime, nullable=False)
 
@@ -166,6 +304,7 @@ class Crawl(db.Model):
             author=crawl_data['author'],
             raw_author=crawl_data['raw_author'].strip(),
         )
+        new_comic.search_key = make_search_key(new_comic.title, new_comic.title_kana, new_comic.raw_author)
         comic_id = Comic.add_comic(new_comic)
         crawl = Crawl(
             comic_id=comic_id,
@@ -176,15 +315,257 @@ class Crawl(db.Model):
         db.session.add(crawl)
         db.session.commit()
 
+    @staticmethod
+    def bulk_add_crawls(crawl_datas):
+        """Crawlをまとめて追加する（同じ(app_id, url)は最初のものだけ．コミットは呼び出し側で行う）"""
+        unique_datas = {}
+        for crawl_data in crawl_datas:
+            unique_datas.setdefault((crawl_data['app_id'], crawl_data['url']), crawl_data)
+        crawl_datas = list(unique_datas.values())
+        comic_ids, new_comics_num = Comic.bulk_get_ids(crawl_datas)
+        crawl_rows = [
+            {
+                'comic_id': comic_ids[crawl_data['title'].strip()],
+                'app_id': crawl_data['app_id'],
+                'url': crawl_data['url'],
+                'crawled_at': crawl_data['crawled_at'],
+            }
+            for crawl_data in crawl_datas
+        ]
+        if crawl_rows:
+            db.session.execute(insert(Crawl), crawl_rows)
+        return new_comics_num
+
+    @staticmethod
+    def sync_crawls(app_id, crawl_datas, chunk_size=500):
+        """(app_id, url)をキーに差分だけを書き込む（コミットは呼び出し側で行う）
+
+        新しいurlだけを追加し，無くなったurlだけを削除して，残ったものは
+        crawled_atだけをまとめて更新する．同じurlで作品が変わった場合は削除と追加として扱う．
+        以前の保存で同じurlの行が複数残っていれば，idの最も小さい1行だけを残して削除する．
+        """
+        unique_datas = {}
+        for crawl_data in crawl_datas:
+            unique_datas.setdefault(crawl_data['url'], crawl_data)
+        crawl_datas = list(unique_datas.values())
+        comic_ids, _ = Comic.bulk_get_ids(crawl_datas)
+
+        existing = defaultdict(list)
+        for crawl_id, url, comic_id in db.session.query(Crawl.id, Crawl.url, Crawl.comic_id).filter_by(app_id=app_id):
+            existing[url].append((crawl_id, comic_id))
+        new_rows = []
+        removed_ids = []
+        survivors = defaultdict(list)
+        for crawl_data in crawl_datas:
+            comic_id = comic_ids[crawl_data['title'].strip()]
+            rows = existing.pop(crawl_data['url'], [])
+            kept_id = min((crawl_id for crawl_id, old_comic_id in rows if old_comic_id == comic_id), default=None)
+            removed_ids.extend(crawl_id for crawl_id, _ in rows if crawl_id != kept_id)
+            if kept_id is not None:
+                survivors[crawl_data['crawled_at']].append(kept_id)
+                continue
+            new_rows.append({
+                'comic_id': comic_id,
+                'app_id': app_id,
+                'url': crawl_data['url'],
+                'crawled_at': crawl_data['crawled_at'],
+            })
+
+        # 無くなったものを削除
+        removed_ids.extend(crawl_id for rows in existing.values() for crawl_id, _ in rows)
+        for i in range(0, len(removed_ids), chunk_size):
+            Crawl.query.filter(Crawl.id.in_(removed_ids[i:i + chunk_size])).delete(synchronize_session=False)
+        # 残ったもののcrawled_atを更新（通常はクロール全体で同じ日時なので1文で済む）
+        if len(survivors) == 1:
+            crawled_at, = survivors
+            Crawl.query.filter_by(app_id=app_id).update({Crawl.crawled_at: crawled_at}, synchronize_session=False)
+        else:
+            for crawled_at, crawl_ids in survivors.items():
+                for i in range(0, len(crawl_ids), chunk_size):
+                    Crawl.query.filter(Crawl.id.in_(crawl_ids[i:i + chunk_size])).update(
+                        {Crawl.crawled_at: crawled_at}, synchronize_session=False
+                    )
+        if new_rows:
+            db.session.execute(insert(Crawl), new_rows)
+        return {
+            'added': len(new_rows),
+            'removed': len(removed_ids),
+            'unchanged': sum(map(len, survivors.values())),
+        }
+
 
 class CrawlHistory(db.Model):
     __tablename__ = 'crawl_history'
+    # アプリごとの最新のCrawlHistory（app_idごとのidの最大）をインデックスだけで求める
+    __table_args__ = (db.Index('ix_crawl_history_app_id_id', 'app_id', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     app_id = db.Column(db.Integer, db.ForeignKey('app.id'), nullable=False)
-    crawled_at = db.Column(db.DateTime, default=datetime.datetime.now(), nullable=False)
+    # クロールの予定は最近の分だけを読む
+    crawled_at = db.Column(db.DateTime, default=datetime.datetime.now, nullable=False, index=True)
     status = db.Column(Enum('success', 'failure', name='crawl_status_enum'), nullable=False)
     comics_num = db.Column(db.Integer)
+    added_num = db.Column(db.Integer)
+    removed_num = db.Column(db.Integer)
+    unchanged_num = db.Column(db.Integer)
     detail = db.Column(db.String(1000))
 
     def __repr__(self):
-        return f'<CrawlHistory {self.app_id} {self.crawled_at}>'
\ No newline at end of file
+        return f'<CrawlHistory {self.app_id} {self.crawled_at}>'
+
+
+class CrawlJob(db.Model):
+    """バックグラウンドで実行するクロールのジョブ"""
+    __tablename__ = 'crawl_job'
+    id = db.Column(db.Integer, primary_key=True)
+    app_id = db.Column(db.Integer, db.ForeignKey('app.id'), nullable=False)
+    # 実行待ちか実行中のあいだだけapp_idを入れて，同じアプリのジョブを1つにする
+    active_app_id = db.Column(db.Integer, unique=True)
+    # 実行中のあいだだけアクセス間隔の単位（politeness_key）を入れて，HostSchedulerを共有しない
+    # 別のワーカーのプロセスが同じホスト（のまとまり）を同時にクロールしないようにする
+    running_key = db.Column(db.String(255), unique=True)
+    status = db.Column(Enum('queued', 'running', 'success', 'failure', name='crawl_job_status_enum'), nullable=False, default='queued')
+    phase = db.Column(Enum('queued', 'crawling', 'saving', 'done', name='crawl_job_phase_enum'), nullable=False, default='queued')
+    # 取得したページ数（実行中の進み具合）
+    pages = db.Column(db.Integer, nullable=False, default=0)
+    comics_num = db.Column(db.Integer)
+    added_num = db.Column(db.Integer)
+    removed_num = db.Column(db.Integer)
+    unchanged_num = db.Column(db.Integer)
+    detail = db.Column(db.String(1000))
+    worker = db.Column(db.String(100))
+    created_at = db.Column(db.DateTime, default=datetime.datetime.now, nullable=False)
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+    app = db.relationship('App')
+
+    def __repr__(self):
+        return f'<CrawlJob {self.id} {self.app_id} {self.status}>'
+
+    def to_dict(self):
+        def format_datetime(value):
+            return value.strftime('%Y/%m/%d %H:%M:%S') if value else None
+        return {
+            'id': self.id,
+            'app_id': self.app_id,
+            'app_name': self.app.name,
+            'status': self.status,
+            'phase': self.phase,
+            'pages': self.pages,
+            'comics_num': self.comics_num,
+            'added_num': self.added_num,
+            'removed_num': self.removed_num,
+            'unchanged_num': self.unchanged_num,
+            'detail': self.detail,
+            'created_at': format_datetime(self.created_at),
+            'started_at': format_datetime(self.started_at),
+            'finished_at': format_datetime(self.finished_at),
+        }
+
+    @staticmethod
+    def enqueue(app_id):
+        """ジョブを追加して(ジョブ, 追加したか)を返す．同じアプリのジョブが待ちか実行中ならそれを返す"""
+        job = CrawlJob.query.filter_by(active_app_id=app_id).first()
+        if job is not None:
+            return job, False
+        job = CrawlJob(app_id=app_id, active_app_id=app_id, status='queued', phase='queued')
+        db.session.add(job)
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # 同時に追加されたら先に追加されたほうを返す
+            db.session.rollback()
+            return CrawlJob.query.filter_by(active_app_id=app_id).first(), False
+        return job, True
+
+    @staticmethod
+    def claim(worker):
+        """実行できる一番古い実行待ちのジョブを実行中にしてidを返す（無ければNone）
+
+        アクセス間隔の単位（politeness_key）が同じジョブが実行中なら，そのジョブは飛ばす．
+        他のワーカーに先に取られたら（同じ単位のジョブを同時に取ろうとした場合も）次のジョブを試す．
+        """
+        while True:
+            running_keys = {
+                key for key, in db.session.query(CrawlJob.running_key).filter(CrawlJob.running_key.isnot(None))
+            }
+            queued = db.session.query(CrawlJob.id, App.site_url).join(App, App.id == CrawlJob.app_id).filter(
+                CrawlJob.status == 'queued'
+            ).order_by(CrawlJob.id).all()
+            candidate = next((
+                (job_id, politeness_key(site_url or '')) for job_id, site_url in queued
+                if politeness_key(site_url or '') not in running_keys
+            ), None)
+            if candidate is None:
+                # 次に確認するときに新しいジョブが見えるようにトランザクションを終える
+                db.session.commit()
+                return None
+            job_id, key = candidate
+            now = datetime.datetime.now()
+            try:
+                claimed = CrawlJob.query.filter_by(id=job_id, status='queued').update({
+                    'status': 'running',
+                    'running_key': key,
+                    'worker': worker,
+                    'started_at': now,
+                    'heartbeat_at': now,
+                })
+                db.session.commit()
+            except IntegrityError:
+                # 同じ単位のジョブを他のワーカーが先に実行し始めた
+                db.session.rollback()
+                continue
+            if claimed:
+                return job_id
+
+    @staticmethod
+    def set(job_id, **values):
+        """ジョブの列を更新する（他の列は上書きしない）"""
+        CrawlJob.query.filter_by(id=job_id).update(values)
+        db.session.commit()
+
+    @staticmethod
+    def finish(job_id, status, **values):
+        CrawlJob.set(job_id, status=status, phase='done', active_app_id=None, running_key=None,
+                     finished_at=datetime.datetime.now(), **values)
+
+    @staticmethod
+    def fail_stale(seconds):
+        """seconds秒以上ハートビートの無い実行中のジョブを失敗にする（ワーカーが落ちたもの）"""
+        threshold = datetime.datetime.now() - datetime.timedelta(seconds=seconds)
+        failed = CrawlJob.query.filter(CrawlJob.status == 'running', CrawlJob.heartbeat_at < threshold).update({
+            'status': 'failure',
+            'phase': 'done',
+            'active_app_id': None,
+            'running_key': None,
+            'detail': 'worker lost',
+            'finished_at': datetime.datetime.now(),
+        })
+        db.session.commit()
+        return failed
+
+
+class CacheVersion(db.Model):
+    """プロセスごとのキャッシュを無効化するためのバージョン"""
+    __tablename__ = 'cache_version'
+    name = db.Column(db.String(50), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f'<CacheVersion {self.name} {self.version}>'
+
+    @staticmethod
+    def get_versions(*names):
+        """namesの順番でバージョンのタプルを返す"""
+        rows = db.session.query(CacheVersion.name, CacheVersion.version).filter(CacheVersion.name.in_(names)).all()
+        version_dict = dict(rows)
+        return tuple(version_dict.get(name, 0) for name in names)
+
+    @staticmethod
+    def bump(name):
+        """バージョンを上げる（コミットは呼び出し側で行う）"""
+        updated = CacheVersion.query.filter_by(name=name).update(
+            {CacheVersion.version: CacheVersion.version + 1}
+        )
+        if not updated:
+            db.session.add(CacheVersion(name=name, version=1))
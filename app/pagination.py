@@ -0,0 +1,82 @@
+import json
+import base64
+import bisect
+
+from sqlalchemy import or_, and_
+
+from app import db
+from app.models import Comic, Crawl
+from app.comic_rows import comic_rows_query, group_rows
+
+
+class PaginationError(ValueError):
+    """limitやcursorの値が不正"""
+    pass
+
+
+def encode_cursor(title_kana, comic_id):
+    """(title_kana, id)から次のページのcursorを作る"""
+    raw = json.dumps([title_kana, comic_id], ensure_ascii=False).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor):
+    """cursorを(title_kana, id)に戻す"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        title_kana, comic_id = json.loads(raw.decode('utf-8'))
+    except Exception:
+        raise PaginationError(f'invalid cursor {cursor}')
+    if not isinstance(title_kana, str) or not isinstance(comic_id, int):
+        raise PaginationError(f'invalid cursor {cursor}')
+    return title_kana, comic_id
+
+
+def parse_page_args(args):
+    """リクエストのlimit, cursorを取得する（limitがなければページングしない）"""
+    limit = args.get('limit')
+    cursor = args.get('cursor')
+    if limit is None:
+        return None, None
+    try:
+        limit = int(limit)
+    except ValueError:
+        raise PaginationError(f'invalid limit {limit}')
+    if limit <= 0:
+        raise PaginationError(f'invalid limit {limit}')
+    after = decode_cursor(cursor) if cursor else None
+    return limit, after
+
+
+def paginate_comics(limit, after=None):
+    """ComicRowを(title_kana, id)のキーセットでページングする
+
+    OFFSETを使わず，前のページの最後の(title_kana, id)より後ろを範囲で読む．
+    ページのComicをサブクエリで絞ってからCrawlをJOINするので，1回のクエリで済む．
+    """
+    query = db.session.query(Comic.id, Comic.title, Comic.title_kana, Comic.author, Comic.raw_author)
+    if after is not None:
+        title_kana, comic_id = after
+        # title_kana >= の条件はインデックスの範囲検索にするため（ORだけだと全体を走査する）
+        query = query.filter(Comic.title_kana >= title_kana, or_(
+            Comic.title_kana > title_kana,
+            and_(Comic.title_kana == title_kana, Comic.id > comic_id),
+        ))
+    page = query.order_by(Comic.title_kana, Comic.id).limit(limit + 1).subquery()
+    rows = comic_rows_query(page).order_by(page.c.title_kana, page.c.id, Crawl.id).all()
+    comics = list(group_rows(rows))
+    next_cursor = None
+    if len(comics) > limit:
+        comics = comics[:limit]
+        next_cursor = encode_cursor(comics[-1].title_kana, comics[-1].id)
+    return comics, next_cursor
+
+
+def paginate_keys(keys, limit, after=None):
+    """(title_kana, id)順に並んだキーのリストをページングする"""
+    start = 0 if after is None else bisect.bisect_right(keys, tuple(after))
+    page = keys[start:start + limit]
+    next_cursor = None
+    if start + limit < len(keys):
+        next_cursor = encode_cursor(*page[-1])
+    return page, next_cursor
@@ -0,0 +1,78 @@
+import time
+import threading
+from urllib.parse import urlparse
+from concurrent.futures import ThreadPoolExecutor
+
+from app import app
+
+
+def host_concurrency(key):
+    """同じホストに同時に送ってよいリクエストの数"""
+    return app.config['CRAWL_HOST_CONCURRENCY'].get(key, app.config['CRAWL_DEFAULT_CONCURRENCY'])
+
+
+def politeness_key(url):
+    """アクセス間隔を共有する単位（基本はホスト，同じ基盤のホストはまとめる）"""
+    host = urlparse(url).netloc.lower()
+    return app.config['CRAWL_HOST_GROUPS'].get(host, host)
+
+
+class HostScheduler:
+    """ホストごとにリクエストの間隔をスレッドをまたいで守らせる
+
+    wait()はリクエストを送る直前に呼ぶ．前のリクエストから間隔が空くまで待ち，
+    次の枠を予約してから返るので，同時に待っている他のスレッドは順番にずれる．
+    最後のリクエストの後には待たない．
+
+    間隔はCrawl-delayを下限として，record()で記録した応答時間が長くなったり
+    429/503が返ってきたりすると広がり，正常な応答が続くと下限に戻っていく．
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._next_slot = {}
+        self._latency = {}
+        self._penalty = {}
+
+    def delay(self, key, min_delay):
+        """次のリクエストまでの間隔"""
+        latency = self._latency.get(key, 0)
+        delay = max(min_delay, latency * app.config['FETCH_LATENCY_FACTOR'])
+        delay *= self._penalty.get(key, 1)
+        return min(max(delay, min_delay), max(min_delay, app.config['FETCH_MAX_DELAY']))
+
+    def wait(self, key, min_delay):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next_slot.get(key, 0))
+            self._next_slot[key] = start + self.delay(key, min_delay)
+        waited = start - now
+        if waited > 0:
+            time.sleep(waited)
+        return waited
+
+    def record(self, key, elapsed, status_code):
+        """応答時間とステータスコードから間隔を調整する"""
+        with self._lock:
+            latency = self._latency.get(key)
+            self._latency[key] = elapsed if latency is None else latency * 0.7 + elapsed * 0.3
+            if status_code in (429, 503):
+                self._penalty[key] = min(self._penalty.get(key, 1) * 2, 32)
+            elif status_code < 400:
+                self._penalty[key] = max(self._penalty.get(key, 1) * 0.8, 1)
+
+
+host_scheduler = HostScheduler()
+
+
+def map_concurrently(func, items, key):
+    """itemsをホストの並列数の範囲でfuncに渡し，結果を元の順番で返すイテレーター
+
+    funcの中でリクエストを送るたびにapply_crawl_delay()を通すので，
+    間隔は守ったまま通信と解析が重なる．
+    """
+    executor = ThreadPoolExecutor(max_workers=host_concurrency(key))
+    try:
+        yield from executor.map(func, items)
+    finally:
+        # 途中で失敗したら残りのリクエストは送らない
+        executor.shutdown(wait=True, cancel_futures=True)
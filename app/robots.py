@@ -0,0 +1,252 @@
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from urllib.parse import urlparse
+
+from app import app
+from app.fetcher import fetch_client
+from app.politeness import host_scheduler, politeness_key
+
+
+class RobotsTxtError(Exception):
+    """RobotsTxtのエラー"""
+    pass
+
+
+def robots_origin(url):
+    """robots.txtが適用される範囲（scheme://host）"""
+    parsed = urlparse(url)
+    return f'{parsed.scheme.lower()}://{parsed.netloc.lower()}'
+
+
+def robots_path(url):
+    """ルールと照合するパス（クエリも含める）"""
+    parsed = urlparse(url)
+    path = parsed.path or '/'
+    if parsed.query:
+        path += '?' + parsed.query
+    return path
+
+
+class RobotsRules:
+    """Allow/Disallowのルールをまとめて照合できる形にしたもの
+
+    ワイルドカードのないルールは前方一致のトライに入れ，パスを1文字ずつ
+    たどるだけで一致するルールが全て見つかるようにする．
+    '*'や'$'を含むルールだけは正規表現にしておく．
+    一致したルールのうち最も長いものに従い，同じ長さならAllowを優先する．
+    """
+    # トライのノードでルールを持たせるキー（パスの1文字とは重ならない）
+    RULE = ''
+
+    def __init__(self, allow=(), disallow=()):
+        self.trie = {}
+        self.patterns = []
+        for path in allow:
+            self.add(path, True)
+        for path in disallow:
+            self.add(path, False)
+
+    def add(self, path, allowed):
+        # 空のDisallowは全て許可という意味なので何もしない
+        if not path:
+            return
+        if '*' in path or path.endswith('$'):
+            end = path.endswith('$')
+            body = path[:-1] if end else path
+            regex = '.*'.join(map(re.escape, body.split('*'))) + ('$' if end else '')
+            self.patterns.append((re.compile(regex, re.DOTALL), len(path), allowed))
+            return
+        node = self.trie
+        for char in path:
+            node = node.setdefault(char, {})
+        # 同じパスがAllowとDisallowの両方にあればAllowを優先する
+        node[self.RULE] = node.get(self.RULE, False) or allowed
+
+    def match(self, path):
+        """pathに一致するルールのうち優先されるもの（長さ, 許可するか），なければNone"""
+        best = None
+        node = self.trie
+        for length, char in enumerate(path, 1):
+            node = node.get(char)
+            if node is None:
+                break
+            if self.RULE in node:
+                best = (length, node[self.RULE])
+        for regex, length, allowed in self.patterns:
+            if (best is None or (length, allowed) > best) and regex.match(path):
+                best = (length, allowed)
+        return best
+
+    def is_allowed(self, path):
+        best = self.match(path)
+        return best is None or best[1]
+
+
+class RobotsTxt:
+    def __init__(self, url, robots_txt=None):
+        self.url = url
+        self.host_key = politeness_key(url)
+        if robots_txt is None:
+            self._get_robots_txt()
+        else:
+            self.robots_txt = robots_txt
+        self._parse_robots_txt()
+
+    @property
+    def robots_txt_url(self):
+        # robots.txtはパスに関係なくホストの直下に置かれる
+        return robots_origin(self.url) + '/robots.txt'
+
+    def _get_robots_txt(self):
+        """robots.txtを取得する"""
+        # Crawl-delayはまだ分からないので既定の間隔を空ける
+        res = fetch_client.get(self.robots_txt_url, key=self.host_key, min_delay=1)
+        if res.status_code != 200:
+            self.robots_txt = ""
+            return
+        self.robots_txt = res.text
+
+    def _parse_robots_txt(self):
+        """robots.txtを解析する
+
+        User-agent: *のグループ（複数あればまとめる）のルールを使う．
+        フィールド名の大文字小文字や':'の後の空白の有無は問わない．
+        """
+        self.robots_dict = {
+            'crawl-delay': 1,
+            'disallow': [],
+            'allow': [],
+            'sitemap': [],
+            'else': []
+        }
+        in_group = False
+        # 直前の行がUser-agentならグループの続き
+        reading_agents = False
+        for line in self.robots_txt.splitlines():
+            # コメントを除去する
+            line = line.split('#', 1)[0].strip()
+            if ':' not in line:
+                continue
+            field, value = line.split(':', 1)
+            field, value = field.strip().lower(), value.strip()
+            if field == 'user-agent':
+                if not reading_agents:
+                    in_group = False
+                in_group = in_group or value == '*'
+                reading_agents = True
+                continue
+            reading_agents = False
+            if field == 'sitemap':
+                self.robots_dict['sitemap'].append(value)
+            elif not in_group:
+                continue
+            elif field == 'crawl-delay':
+                try:
+                    self.robots_dict['crawl-delay'] = float(value)
+                except ValueError:
+                    self.robots_dict['else'].append([field, value])
+            elif field in ('disallow', 'allow'):
+                self.robots_dict[field].append(value)
+            else:
+                self.robots_dict['else'].append([field, value])
+        self.rules = RobotsRules(self.robots_dict['allow'], self.robots_dict['disallow'])
+
+    @property
+    def crawl_delay(self):
+        return self.robots_dict['crawl-delay']
+
+    def apply_crawl_delay(self):
+        """クロール間隔を守る（リクエストの直前に呼ぶ）
+
+        間隔はホストごとに全てのクローラーで共有される．
+        """
+        host_scheduler.wait(self.host_key, self.crawl_delay)
+
+    def is_allowed(self, url):
+        return self.rules.is_allowed(robots_path(url))
+
+    def check_disallow(self, url):
+        """urlがdisallowされているかを判定する"""
+        if not self.is_allowed(url):
+            raise RobotsTxtError(f'{url} is disallowed by robots.txt')
+
+
+class RobotsTxtCache:
+    """プロセス内で共有するrobots.txtのキャッシュ
+
+    オリジン（scheme://host）ごとにROBOTS_TXT_TTL秒の間は使い回す．
+    ROBOTS_TXT_CACHE_DIRを設定すると取得した内容をファイルにも保存し，
+    プロセスを再起動しても期限内なら取得し直さない．
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._locks = {}
+        self._entries = {}
+
+    def _origin_lock(self, origin):
+        with self._lock:
+            return self._locks.setdefault(origin, threading.Lock())
+
+    def _cache_path(self, origin):
+        cache_dir = app.config['ROBOTS_TXT_CACHE_DIR']
+        if not cache_dir:
+            return None
+        return os.path.join(cache_dir, hashlib.sha1(origin.encode()).hexdigest() + '.json')
+
+    def _load(self, origin):
+        """ファイルに保存したrobots.txtを読む（期限切れならNone）"""
+        path = self._cache_path(origin)
+        if path is None or not os.path.exists(path):
+            return None
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if time.time() - data['fetched_at'] >= app.config['ROBOTS_TXT_TTL']:
+            return None
+        return data
+
+    def _save(self, origin, robots_txt, fetched_at):
+        path = self._cache_path(origin)
+        if path is None:
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # 書きかけのファイルを他のプロセスに読ませない
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump({'origin': origin, 'fetched_at': fetched_at, 'robots_txt': robots_txt}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+    def get(self, url):
+        """urlのホストのRobotsTxtを返す（期限切れなら取得し直す）"""
+        origin = robots_origin(url)
+        entry = self._entries.get(origin)
+        if entry is not None and time.time() < entry[0]:
+            return entry[1]
+        # 同じホストを同時に取得しに行かない
+        with self._origin_lock(origin):
+            entry = self._entries.get(origin)
+            if entry is not None and time.time() < entry[0]:
+                return entry[1]
+            data = self._load(origin)
+            if data is not None:
+                robots_txt = RobotsTxt(origin, data['robots_txt'])
+                fetched_at = data['fetched_at']
+            else:
+                robots_txt = RobotsTxt(origin)
+                fetched_at = time.time()
+                self._save(origin, robots_txt.robots_txt, fetched_at)
+            self._entries[origin] = (fetched_at + app.config['ROBOTS_TXT_TTL'], robots_txt)
+            return robots_txt
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+robots_cache = RobotsTxtCache()
@@ -1,14 +1,38 @@
 import re
 import time
+import datetime
+from functools import partial
 from urllib.parse import urljoin
 
-from sqlalchemy.orm import joinedload
 from sqlalchemy import func, or_, and_
 from flask import Flask, render_template, request, jsonify
 
 from app import app, db
-from app.models import App, Comic, Crawl, CrawlHistory
+from app.models import App, Crawl, CrawlHistory, CrawlJob
+from app.cache import app_registry
+from app.comic_rows import load_comic, load_comics, iter_comic_rows
+from app.compression import compress_response
 from app.crawler import ComicCrawler
+from app.crawl_runner import crawlable_apps
+from app.crawl_schedule import build_schedule
+from app.pagination import PaginationError, parse_page_args, paginate_comics, paginate_keys
+from app.search_index import comic_index, kana_index, suggest_index, warm_up_indexes
+from app.serializers import serialize_comic_detail, serialize_comic, serialize_comic_table_row
+from app.snapshot import comics_snapshot, comics_table_snapshot, snapshot_response, warm_up_snapshots
+from app.streaming import stream_json_data, stream_requested
+
+
+@app.before_request
+def warm_up():
+    if app.config['SEARCH_INDEX_WARM_UP']:
+        warm_up_indexes()
+    if app.config['SNAPSHOT_WARM_UP']:
+        warm_up_snapshots()
+
+
+@app.after_request
+def compress(response):
+    return compress_response(response)
 
 
 @app.route('/')
@@ -24,17 +48,76 @@ def app_status():
 
 @app.route('/crawl', methods=['POST'])
 def crawl():
+    """クロールのジョブを追加してすぐに返す（実行はflask crawl-workerで行う）"""
     data = request.json
     app_name = data.get('app_name')
     # app_nameを検索
     app_query = App.query.filter_by(name=app_name).first()
     if app_query is None:
         return 'App not found'
-    crawler = ComicCrawler(app_query)
-    crawl_res = crawler.crawl()
-    if crawl_res['status_code'] == 200:
-        crawler.save()
-    return jsonify(crawl_res['dict']), crawl_res['status_code']
+    if app_query.name not in ComicCrawler.CRAWL_FUNCS:
+        return 'App is not crawlable', 400
+    job, created = CrawlJob.enqueue(app_query.id)
+    return jsonify(dict(job.to_dict(), created=created)), 202
+
+
+@app.route('/crawl_all', methods=['POST'])
+def crawl_all_api():
+    """全てのアプリのクロールのジョブを追加する"""
+    jobs = []
+    for app_record in crawlable_apps():
+        job, created = CrawlJob.enqueue(app_record.id)
+        jobs.append(dict(job.to_dict(), created=created))
+    return jsonify({'data': jobs}), 202
+
+
+@app.route('/api/crawl_jobs/<int:job_id>', methods=['GET'])
+def crawl_job_api(job_id):
+    job = db.session.get(CrawlJob, job_id)
+    if job is None:
+        return 'Job not found', 404
+    return jsonify({'data': job.to_dict()})
+
+
+@app.route('/api/crawl_jobs', methods=['GET'])
+def crawl_jobs_api():
+    """最近のジョブ（app_nameとstatusで絞り込める）"""
+    data = request.args
+    query = CrawlJob.query
+    if data.get('app_name'):
+        query = query.join(App, CrawlJob.app_id == App.id).filter(App.name == data.get('app_name'))
+    if data.get('status'):
+        query = query.filter(CrawlJob.status == data.get('status'))
+    try:
+        limit = min(int(data.get('limit', 50)), 500)
+    except ValueError:
+        return 'limit must be an integer', 400
+    jobs = query.order_by(CrawlJob.id.desc()).limit(limit).all()
+    return jsonify({'data': [job.to_dict() for job in jobs]})
+
+
+@app.route('/api/crawl_schedule', methods=['GET'])
+def crawl_schedule_api():
+    """アプリごとの次のクロールの予定（早い順）"""
+    def format_datetime(value):
+        return value.strftime('%Y/%m/%d %H:%M:%S') if value else None
+
+    now = datetime.datetime.now()
+    schedule = []
+    for entry in build_schedule(now):
+        schedule.append({
+            'app_id': entry.app_id,
+            'app_name': entry.app_name,
+            'last_success_at': format_datetime(entry.last_success_at),
+            'last_failure_at': format_datetime(entry.last_failure_at),
+            'failures': entry.failures,
+            'change_rate': entry.change_rate,
+            'interval_hours': round(entry.interval / 3600, 1),
+            'next_run_at': format_datetime(entry.next_run_at),
+            'due': entry.next_run_at <= now,
+            'job_status': entry.job_status,
+        })
+    return jsonify({'data': schedule})
 
 
 @app.route('/api/comic', methods=['GET'])
@@ -42,34 +125,14 @@ def comic_api():
     data = request.args
     comic_id = data.get('id')
 
-    # アプリの情報をデータベースから取得
-    apps = App.query.all()
-    app_dict = {app_record.id: app_record for app_record in apps}
+    # アプリの情報はキャッシュから取得
+    app_dict = app_registry.get()
 
-    comic = Comic.query.filter_by(id=comic_id).options(joinedload(Comic.crawls)).first()
+    comic = load_comic(comic_id)
     if comic is None:
         return 'Comic not found', 404
     
-    res = {
-        'id': comic.id,
-        'title': comic.title,
-        'title_kana': comic.title_kana,
-        'author': comic.author,
-        'raw_author': comic.raw_author,
-        'apps': [
-            {
-                'name': app_dict[crawl.app_id].name,
-                'img_url': urljoin(app.config['DEPLOY_URL'], app_dict[crawl.app_id].img_url),
-                'platform_type': app_dict[crawl.app_id].platform_type,
-                'app_store_url': app_dict[crawl.app_id].app_store_url,
-                'google_play_url': app_dict[crawl.app_id].google_play_url,
-                'site_url': app_dict[crawl.app_id].site_url,
-                'url': crawl.url,
-                'crawled_at': crawl.crawled_at.strftime('%Y/%m/%d'),
-            }
-            for crawl in comic.crawls
-        ],
-    }
+    res = serialize_comic_detail(comic, app_dict)
     return jsonify({'data': res})
 
 
@@ -78,78 +141,90 @@ def comics_api():
 
     data = request.args
     fifty = data.get('fifty')
+    row = data.get('row')
     keywords = data.get('keywords')
-
-    # アプリの情報をデータベースから取得
-    apps = App.query.all()
-    app_name_dict = {app_record.id: app_record.name for app_record in apps}
-    app_img_url_dict = {app_record.id: app_record.img_url for app_record in apps}
-
-    if fifty:
-        tmp = Comic.query.filter(Comic.title_kana.like(f'{fifty}%')).options(joinedload(Comic.crawls))
-        comics = tmp.order_by(Comic.title_kana).all()
-    elif keywords:
-        keywords_list = re.split(r'[ 　]', keywords)
-        columns_list = [Comic.title, Comic.title_kana, Comic.raw_author]
-        conditions = [or_(*[column.like(f'%{keyword}%') for column in columns_list]) for keyword in keywords_list]
-        tmp = Comic.query.filter(and_(*conditions)).options(joinedload(Comic.crawls))
-        comics = tmp.order_by(Comic.title_kana).all()
+    stream = stream_requested(data)
+    try:
+        limit, after = parse_page_args(data)
+    except PaginationError as e:
+        return str(e), 400
+
+    if not (row or fifty or keywords or limit or stream):
+        # 全件はスナップショットを返す（まだ作っていなければ作るのを待たずにストリーミングする）
+        return snapshot_response(comics_snapshot)
+
+    # アプリの情報はキャッシュから取得
+    app_dict = app_registry.get()
+    func_comic = partial(serialize_comic, app_dict=app_dict)
+
+    next_cursor = None
+    if row or fifty or keywords:
+        if row:
+            # 五十音の行ごとにまとめて返す
+            comic_keys = kana_index.row(row)
+        elif fifty:
+            comic_keys = kana_index.prefix(fifty)
+        else:
+            # n-gramインデックスで絞り込み，DBには該当idのComicだけを取りに行く
+            comic_keys = comic_index.search(keywords)
+        if limit:
+            comic_keys, next_cursor = paginate_keys(comic_keys, limit, after)
+        comics = load_comics([comic_id for _, comic_id in comic_keys])
+    elif limit:
+        comics, next_cursor = paginate_comics(limit, after)
     else:
-        comics = Comic.query.options(joinedload(Comic.crawls)).all()
-
-    def func_comic(comic):
-        res = {
-            'id': comic.id,
-            'title': comic.title,
-            'title_kana': comic.title_kana,
-            'author': comic.author,
-            'raw_author': comic.raw_author,
-            'apps': [
-                {
-                    'name': app_name_dict[crawl.app_id],
-                    'img_url': urljoin(app.config['DEPLOY_URL'], app_img_url_dict[crawl.app_id]),
-                    'url': crawl.url,
-                    'crawled_at': crawl.crawled_at.strftime('%Y/%m/%d'),
-                }
-                for crawl in comic.crawls
-            ],
-        }
-        return res
+        # 全件を一度に読み込まず，少しずつ取得しながら書き出す
+        return stream_json_data(map(func_comic, iter_comic_rows()))
+
     table_data = list(map(func_comic, comics))
+    if limit:
+        return jsonify({'data': table_data, 'next': next_cursor})
     return jsonify({'data': table_data})
 
 
 @app.route('/api/comics_table', methods=['GET'])
 def comics_table_api():
-    comics = Comic.query.options(joinedload(Comic.crawls)).all()
-
-    # アプリの情報をデータベースから取得
-    apps = App.query.all()
-    app_dict = {app_record.id: app_record.name for app_record in apps}
-
-    def func_comic(comic):
-        res = {
-            'title': comic.title,
-            'title_kana': comic.title_kana,
-            'author': comic.author,
-            'raw_author': comic.raw_author,
-            'apps': [
-                {
-                    'app_name': app_dict[crawl.app_id],
-                    'url': crawl.url,
-                    'crawled_at': crawl.crawled_at.strftime('%Y/%m/%d'),
-                }
-                for crawl in comic.crawls
-            ],
-        }
-        return res
+    stream = stream_requested(request.args)
+    try:
+        limit, after = parse_page_args(request.args)
+    except PaginationError as e:
+        return str(e), 400
+
+    if not (limit or stream):
+        # 全件はスナップショットを返す（まだ作っていなければ作るのを待たずにストリーミングする）
+        return snapshot_response(comics_table_snapshot)
+
+    # アプリの情報はキャッシュから取得
+    app_dict = app_registry.get()
+    func_comic = partial(serialize_comic_table_row, app_dict=app_dict)
+
+    if not limit:
+        # 全件を一度に読み込まず，少しずつ取得しながら書き出す
+        return stream_json_data(map(func_comic, iter_comic_rows()))
+
+    comics, next_cursor = paginate_comics(limit, after)
     table_data = list(map(func_comic, comics))
-    return jsonify({'data': table_data})
+    return jsonify({'data': table_data, 'next': next_cursor})
+
+
+@app.route('/api/suggest', methods=['GET'])
+def suggest_api():
+    """入力中の文字列（タイトル，ふりがな，ローマ字）に前方一致する作品の候補"""
+    q = request.args.get('q', '')
+    limit = request.args.get('limit', app.config['SUGGEST_LIMIT'])
+    try:
+        limit = int(limit)
+    except ValueError:
+        return f'invalid limit {limit}', 400
+    if not 0 < limit <= app.config['SUGGEST_MAX_LIMIT']:
+        return f'invalid limit {limit}', 400
+    suggestions = suggest_index.suggest(q, limit)
+    return jsonify({'data': [{'id': comic_id, 'title': title} for comic_id, title in suggestions]})
 
 
 @app.route('/api/app_status_table', methods=['GET'])
 def app_status_table_api():
-    apps = App.query.all()
+    apps = app_registry.get().values()
 
     # 各Appの最新のCrawlHistoryのidを取得
     subquery = db.session.query(
@@ -178,10 +253,7 @@ def app_status_table_api():
                 'site_url': app_record.site_url,
             },
         }
-        if app_record.platform_type == 'app': record_dict['platform_type'] = 'アプリ'
-        elif app_record.platform_type == 'web': record_dict['platform_type'] = 'Web'
-        elif app_record.platform_type == 'both': record_dict['platform_type'] = 'アプリ, Web'
-        else: record_dict['platform_type'] = '-'
+        record_dict['platform_type'] = app_record.platform_type_label
         # CrawlHistoryから最新のデータを取得
         # crawl_history = CrawlHistory.query.filter_by(app_id=app_record.id).order_by(CrawlHistory.crawled_at.desc()).first()
         crawl_history = crawl_history_dict.get(app_record.id)
@@ -206,7 +278,7 @@ def app_status_table_api():
 @app.route('/api/app_status_4front', methods=['GET'])
 def app_status_4front_api():
     """フロントのためのAPI"""
-    apps = App.query.all()
+    apps = app_registry.get().values()
 
     # 各Appの最新のCrawlHistoryのidを取得
     subquery = db.session.query(
@@ -228,15 +300,12 @@ def app_status_4front_api():
             'abj_management_number': app_record.abj_management_number,
             'company_name': app_record.company_name,
             'service_type': app_record.service_type,
-            'img_url': urljoin(app.config['DEPLOY_URL'], app_record.img_url),
+            'img_url': app_record.abs_img_url,
             'app_store_url': app_record.app_store_url,
             'google_play_url': app_record.google_play_url,
             'site_url': app_record.site_url,
         }
-        if app_record.platform_type == 'app': record_dict['platform_type'] = 'アプリ'
-        elif app_record.platform_type == 'web': record_dict['platform_type'] = 'Web'
-        elif app_record.platform_type == 'both': record_dict['platform_type'] = 'アプリ, Web'
-        else: record_dict['platform_type'] = '-'
+        record_dict['platform_type'] = app_record.platform_type_label
         # CrawlHistoryから最新のデータを取得
         # crawl_history = CrawlHistory.query.filter_by(app_id=app_record.id).order_by(CrawlHistory.crawled_at.desc()).first()
         crawl_history = crawl_history_dict.get(app_record.id)
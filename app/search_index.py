@@ -0,0 +1,374 @@
+import re
+import time
+import heapq
+import bisect
+import threading
+import unicodedata
+from collections import defaultdict
+
+from sqlalchemy import func, distinct
+
+from app import app, db
+from app.kana import to_romaji
+from app.models import Comic, Crawl, CacheVersion
+from app.search_key import SEARCH_KEY_SEPARATOR, make_search_key, normalize_search_text
+
+
+# 五十音の行（行の先頭の文字で表す）
+GOJUON_ROWS = {
+    'あ': 'あいうえお',
+    'か': 'かきくけこ',
+    'さ': 'さしすせそ',
+    'た': 'たちつてと',
+    'な': 'なにぬねの',
+    'は': 'はひふへほ',
+    'ま': 'まみむめも',
+    'や': 'やゆよ',
+    'ら': 'らりるれろ',
+    'わ': 'わゐゑをん',
+}
+OTHER_ROW = 'その他'
+_ROW_OF_KANA = {kana: row for row, kanas in GOJUON_ROWS.items() for kana in kanas}
+_SMALL_KANA = str.maketrans('ぁぃぅぇぉっゃゅょゎゕゖ', 'あいうえおつやゆよわかけ')
+
+
+def split_keywords(keywords):
+    """検索文字列をキーワードに分割する"""
+    return re.split(r'[ 　]', keywords)
+
+
+def like_to_regex(keyword):
+    """LIKE '%keyword%'と同じ判定をする正規表現を作る"""
+    pattern = ''.join(
+        '.*' if char == '%' else '.' if char == '_' else re.escape(char)
+        for char in keyword
+    )
+    return re.compile(pattern, re.DOTALL)
+
+
+def gojuon_row(text):
+    """先頭の文字が属する五十音の行を返す（カタカナ，濁点，小書きは畳み込む）"""
+    if not text:
+        return OTHER_ROW
+    char = text[0]
+    # カタカナをひらがなに
+    if 'ァ' <= char <= 'ヶ':
+        char = chr(ord(char) - 0x60)
+    # 濁点・半濁点を外す
+    char = unicodedata.normalize('NFD', char)[0]
+    char = char.translate(_SMALL_KANA)
+    return _ROW_OF_KANA.get(char, OTHER_ROW)
+
+
+class CatalogIndex:
+    """Comicから作るインメモリインデックスの基底クラス
+
+    Comicの行は追加されるだけで検索対象の列は書き換えられないので，
+    refresh()ではまだ読み込んでいないidの行だけを読み込む．
+    他のプロセスでの保存はCacheVersionの'catalog'で検知する．
+    backfill-search-keysでsearch_keyが書き換えられたことは'search_key'で検知してreindex()する．
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.RLock()
+        self.ids = set()
+        self.max_id = 0
+        self.ready = False
+        self._version = None
+        self._next_check = 0
+
+    def _add_rows(self, rows):
+        raise NotImplementedError
+
+    def _missing_ids(self):
+        """max_id以下で読み込んでいないidのリスト
+
+        保存が並行するとidの小さい行が後からコミットされることがあるので，
+        max_id以下の行の数が読み込んだ数と違うときだけidを全て読んで比べる．
+        """
+        count = db.session.query(func.count(Comic.id)).filter(Comic.id <= self.max_id).scalar()
+        if count == len(self.ids):
+            return []
+        current = {comic_id for comic_id, in db.session.query(Comic.id).filter(Comic.id <= self.max_id)}
+        # 消えたComicは数え直さないように外しておく（検索結果に残っても読み込み時に飛ばされる）
+        self.ids &= current
+        return sorted(current - self.ids)
+
+    def refresh(self, chunk_size=500):
+        """まだ読み込んでいないComicをインデックスに追加する"""
+        with self._refresh_lock:
+            query = db.session.query(Comic.id, Comic.title, Comic.title_kana, Comic.raw_author, Comic.search_key)
+            missing_ids = self._missing_ids()
+            rows = query.filter(Comic.id > self.max_id).all()
+            for i in range(0, len(missing_ids), chunk_size):
+                rows.extend(query.filter(Comic.id.in_(missing_ids[i:i + chunk_size])).all())
+            with self._lock:
+                self._add_rows(rows)
+                self.ids.update(row.id for row in rows)
+                if rows:
+                    self.max_id = max(self.max_id, max(row.id for row in rows))
+                self.ready = True
+        return len(rows)
+
+    def reindex(self):
+        """読み込んだ行のsearch_keyの書き換えを反映する（search_keyを使わないインデックスでは何もしない）"""
+        return 0
+
+    def ensure_built(self):
+        now = time.monotonic()
+        if self.ready and now < self._next_check:
+            return
+        version = CacheVersion.get_versions('catalog', 'search_key')
+        if not self.ready or version != self._version:
+            if self.ready and version[1] != self._version[1]:
+                self.reindex()
+            self.refresh()
+            self._version = version
+        self._next_check = now + app.config['CACHE_VERSION_CHECK_INTERVAL']
+
+
+class NgramIndex(CatalogIndex):
+    """Comicのsearch_key（title, title_kana, raw_authorを正規化したもの）の文字n-gram転置インデックス"""
+    def __init__(self, n=2):
+        super().__init__()
+        self.n = n
+        self.postings = defaultdict(set)
+        self.texts = {}
+        self.sort_keys = {}
+
+    def _ngrams(self, text):
+        """1文字からn文字までのn-gramを列挙する"""
+        for size in range(1, self.n + 1):
+            for i in range(len(text) - size + 1):
+                yield text[i:i + size]
+
+    def _add_rows(self, rows):
+        for row in rows:
+            # backfill-search-keysの前のComicはここで作る
+            search_key = row.search_key
+            if search_key is None:
+                search_key = make_search_key(row.title, row.title_kana, row.raw_author)
+            for text in search_key.split(SEARCH_KEY_SEPARATOR):
+                for gram in self._ngrams(text):
+                    self.postings[gram].add(row.id)
+            self.texts[row.id] = search_key
+            self.sort_keys[row.id] = (row.title_kana, row.id)
+
+    def reindex(self, chunk_size=1000):
+        """search_keyが読み込んだときと変わったComicだけを入れ直す"""
+        with self._refresh_lock:
+            changed = []
+            last_id = 0
+            while True:
+                rows = db.session.query(
+                    Comic.id, Comic.title, Comic.title_kana, Comic.raw_author, Comic.search_key
+                ).filter(
+                    Comic.id > last_id, Comic.id <= self.max_id, Comic.search_key.isnot(None)
+                ).order_by(Comic.id).limit(chunk_size).all()
+                if not rows:
+                    break
+                last_id = rows[-1].id
+                changed.extend(row for row in rows if row.id in self.texts and row.search_key != self.texts[row.id])
+            with self._lock:
+                for row in changed:
+                    for text in self.texts[row.id].split(SEARCH_KEY_SEPARATOR):
+                        for gram in self._ngrams(text):
+                            posting = self.postings.get(gram)
+                            if posting is not None:
+                                posting.discard(row.id)
+                                if not posting:
+                                    del self.postings[gram]
+                self._add_rows(changed)
+        return len(changed)
+
+    def _search_keyword(self, keyword):
+        """1つのキーワードにLIKE '%keyword%'でマッチするidの集合を返す"""
+        # ワイルドカードで区切られた各部分のn-gramで候補を絞る
+        grams = set()
+        for piece in re.split(r'[%_]', keyword):
+            size = min(self.n, len(piece))
+            if size == 0: continue
+            grams.update(piece[i:i + size] for i in range(len(piece) - size + 1))
+        if grams:
+            posting_lists = sorted((self.postings.get(gram, set()) for gram in grams), key=len)
+            candidates = set(posting_lists[0]).intersection(*posting_lists[1:])
+        else:
+            candidates = set(self.texts)
+
+        # n-gramの一致だけでは部分文字列として並んでいるとは限らないので照合する
+        if '%' in keyword or '_' in keyword:
+            # ワイルドカードが列の区切りをまたがないように列ごとに照合する
+            regex = like_to_regex(keyword)
+            return {
+                comic_id for comic_id in candidates
+                if any(regex.search(text) for text in self.texts[comic_id].split(SEARCH_KEY_SEPARATOR))
+            }
+        return {comic_id for comic_id in candidates if keyword in self.texts[comic_id]}
+
+    def search(self, keywords):
+        """全てのキーワードにマッチするComicの(title_kana, id)をtitle_kana順に返す
+
+        キーワードはsearch_keyと同じように正規化するので，全角と半角，カタカナとひらがな，
+        空白の有無の違いがあってもマッチする．
+        """
+        self.ensure_built()
+        # 空白だけのキーワードは（空のLIKEと同じく）全てにマッチする
+        normalized = [normalize_search_text(keyword) for keyword in split_keywords(keywords)]
+        normalized = [keyword for keyword in normalized if keyword] or ['']
+        with self._lock:
+            ids = None
+            for keyword in normalized:
+                matched = self._search_keyword(keyword)
+                ids = matched if ids is None else ids & matched
+                if not ids: break
+            return sorted(self.sort_keys[comic_id] for comic_id in ids or ())
+
+
+class KanaIndex(CatalogIndex):
+    """(title_kana, id)のソート済み配列と五十音の行ごとのグループ"""
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self.rows = {}
+
+    def _add_rows(self, rows):
+        new_entries = [(row.title_kana, row.id) for row in rows]
+        if not new_entries:
+            return
+        if len(new_entries) < 100:
+            for entry in new_entries:
+                bisect.insort(self.entries, entry)
+        else:
+            self.entries = sorted(self.entries + new_entries)
+        grouped = defaultdict(list)
+        for entry in self.entries:
+            grouped[gojuon_row(entry[0])].append(entry)
+        self.rows = dict(grouped)
+
+    def prefix(self, prefix):
+        """title_kanaがprefixで始まるComicの(title_kana, id)をtitle_kana順に返す"""
+        self.ensure_built()
+        with self._lock:
+            if '%' in prefix or '_' in prefix or prefix.lower() != prefix.upper():
+                # ワイルドカードや大文字小文字の区別がある文字はLIKEと同じ判定で走査する
+                regex = like_to_regex(prefix.lower())
+                return [entry for entry in self.entries if regex.match(entry[0].lower())]
+            lo = bisect.bisect_left(self.entries, (prefix,))
+            hi = bisect.bisect_left(self.entries, (prefix + '\U0010ffff',), lo)
+            return self.entries[lo:hi]
+
+    def row(self, kana):
+        """kanaと同じ五十音の行に属するComicの(title_kana, id)をtitle_kana順に返す"""
+        self.ensure_built()
+        row = kana if kana == OTHER_ROW else gojuon_row(kana)
+        with self._lock:
+            return list(self.rows.get(row, []))
+
+
+class SuggestIndex(CatalogIndex):
+    """タイトル，ふりがな，ローマ字の前方一致で入力候補を返す
+
+    3つの表記をsearch_keyと同じように正規化して(表記, id)のソート済み配列に入れ，
+    掲載しているアプリの多い順（同じならtitle_kana順）に返す．
+    候補が多い短い接頭辞（SUGGEST_PREFIX_CACHE_LENGTH文字まで）は上位を作っておく．
+    アプリの数は作品が増えなくても変わるので，refresh()のたびに数え直す．
+    """
+    def __init__(self):
+        super().__init__()
+        self.entries = []
+        self.titles = {}
+        self.title_kanas = {}
+        self.app_counts = {}
+        self.top = {}
+
+    def refresh(self):
+        with self._refresh_lock:
+            app_counts = dict(db.session.query(
+                Crawl.comic_id, func.count(distinct(Crawl.app_id))
+            ).group_by(Crawl.comic_id).all())
+            with self._lock:
+                self.app_counts = app_counts
+            return super().refresh()
+
+    def _rank(self, comic_id):
+        return -self.app_counts.get(comic_id, 0), self.title_kanas[comic_id], comic_id
+
+    def _add_rows(self, rows):
+        romajis = to_romaji([row.title_kana for row in rows])
+        new_entries = []
+        for row, romaji in zip(rows, romajis):
+            self.titles[row.id] = row.title
+            self.title_kanas[row.id] = row.title_kana
+            forms = {normalize_search_text(text) for text in (row.title, row.title_kana, romaji)}
+            new_entries.extend((form, row.id) for form in forms if form)
+        if len(new_entries) < 100:
+            for entry in new_entries:
+                bisect.insort(self.entries, entry)
+        else:
+            self.entries = sorted(self.entries + new_entries)
+
+        # 短い接頭辞ごとの上位（どのアプリにも無い作品は出さない）
+        length = app.config['SUGGEST_PREFIX_CACHE_LENGTH']
+        candidates = defaultdict(set)
+        for form, comic_id in self.entries:
+            if comic_id in self.app_counts:
+                for size in range(1, min(length, len(form)) + 1):
+                    candidates[form[:size]].add(comic_id)
+        limit = app.config['SUGGEST_MAX_LIMIT']
+        self.top = {prefix: heapq.nsmallest(limit, ids, key=self._rank) for prefix, ids in candidates.items()}
+
+    def suggest(self, prefix, limit):
+        """prefixで始まる表記を持つComicの(id, title)を多くてもlimit件返す"""
+        prefix = normalize_search_text(prefix)
+        if not prefix:
+            return []
+        self.ensure_built()
+        with self._lock:
+            if len(prefix) <= app.config['SUGGEST_PREFIX_CACHE_LENGTH']:
+                comic_ids = self.top.get(prefix, [])[:limit]
+            else:
+                lo = bisect.bisect_left(self.entries, (prefix,))
+                hi = bisect.bisect_left(self.entries, (prefix + '\U0010ffff',), lo)
+                ids = {comic_id for _, comic_id in self.entries[lo:hi] if comic_id in self.app_counts}
+                comic_ids = heapq.nsmallest(limit, ids, key=self._rank)
+            return [(comic_id, self.titles[comic_id]) for comic_id in comic_ids]
+
+
+comic_index = NgramIndex()
+kana_index = KanaIndex()
+suggest_index = SuggestIndex()
+
+
+def refresh_indexes():
+    """構築済みのインデックスに追加されたComicを反映する"""
+    for index in (comic_index, kana_index, suggest_index):
+        if index.ready:
+            index.refresh()
+
+
+_warm_up_lock = threading.Lock()
+_warm_up_started = False
+
+
+def warm_up_indexes():
+    """インデックスをバックグラウンドで作り始める（プロセスで1回だけ）
+
+    最初のリクエストで呼び，その後のリクエストが構築を待たずに済むようにする．
+    """
+    global _warm_up_started
+    if _warm_up_started:
+        return
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+
+    def build():
+        with app.app_context():
+            for index in (suggest_index, comic_index, kana_index):
+                try:
+                    index.ensure_built()
+                except Exception as e:
+                    print(f'failed to build {type(index).__name__}: {e}')
+
+    threading.Thread(target=build, daemon=True).start()
@@ -0,0 +1,29 @@
+import re
+import unicodedata
+
+
+SEARCH_KEY_SEPARATOR = '\t'
+_WHITESPACE = re.compile(r'\s+')
+# カタカナをひらがなに（ヽヾも含める）
+_KATAKANA_TO_HIRAGANA = {code: code - 0x60 for code in range(ord('ァ'), ord('ヶ') + 1)}
+_KATAKANA_TO_HIRAGANA.update({ord('ヽ'): ord('ゝ'), ord('ヾ'): ord('ゞ')})
+
+
+def normalize_search_text(text):
+    """検索用に正規化する
+
+    NFKCで全角英数と半角カナをそろえ，小文字にし，カタカナをひらがなにして，空白を取り除く．
+    保存する検索キーと検索のキーワードの両方をこれで正規化する．
+    """
+    if not text:
+        return ''
+    text = unicodedata.normalize('NFKC', text).lower().translate(_KATAKANA_TO_HIRAGANA)
+    return _WHITESPACE.sub('', text)
+
+
+def make_search_key(title, title_kana, raw_author):
+    """title, title_kana, raw_authorを正規化してタブでつないだComicの検索キー
+
+    キーワードは空白を含まないので，タブをまたいで別の列にマッチすることはない．
+    """
+    return SEARCH_KEY_SEPARATOR.join(normalize_search_text(text) for text in (title, title_kana, raw_author))
@@ -0,0 +1,123 @@
+from functools import lru_cache
+from collections import namedtuple
+
+from flask.json.provider import DefaultJSONProvider
+
+from app import app
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# 各APIのappsの要素のうち，アプリだけで決まる部分
+AppFragment = namedtuple('AppFragment', ['detail', 'comic', 'table'])
+
+_fragments = (None, None)
+
+
+def app_fragments(app_dict):
+    """アプリごとのAppFragmentの辞書（同じapp_dictのあいだは作り直さない）"""
+    global _fragments
+    cached_dict, fragments = _fragments
+    if cached_dict is app_dict:
+        return fragments
+    fragments = {
+        app_id: AppFragment(
+            detail={
+                'name': app_info.name,
+                'img_url': app_info.abs_img_url,
+                'platform_type': app_info.platform_type,
+                'app_store_url': app_info.app_store_url,
+                'google_play_url': app_info.google_play_url,
+                'site_url': app_info.site_url,
+            },
+            comic={
+                'name': app_info.name,
+                'img_url': app_info.abs_img_url,
+            },
+            table={
+                'app_name': app_info.name,
+            },
+        )
+        for app_id, app_info in app_dict.items()
+    }
+    _fragments = (app_dict, fragments)
+    return fragments
+
+
+@lru_cache(maxsize=4096)
+def format_date(value):
+    """crawled_atの日付の文字列（1回のクロールのCrawlは同じ日時なので結果を覚えておく）"""
+    return value.strftime('%Y/%m/%d')
+
+
+def serialize_comic_detail(comic, app_dict):
+    """/api/comic用の辞書を作る"""
+    fragments = app_fragments(app_dict)
+    return {
+        'id': comic.id,
+        'title': comic.title,
+        'title_kana': comic.title_kana,
+        'author': comic.author,
+        'raw_author': comic.raw_author,
+        'apps': [
+            {**fragments[crawl.app_id].detail, 'url': crawl.url, 'crawled_at': format_date(crawl.crawled_at)}
+            for crawl in comic.crawls
+        ],
+    }
+
+
+def serialize_comic(comic, app_dict):
+    """/api/comics用の辞書を作る"""
+    fragments = app_fragments(app_dict)
+    return {
+        'id': comic.id,
+        'title': comic.title,
+        'title_kana': comic.title_kana,
+        'author': comic.author,
+        'raw_author': comic.raw_author,
+        'apps': [
+            {**fragments[crawl.app_id].comic, 'url': crawl.url, 'crawled_at': format_date(crawl.crawled_at)}
+            for crawl in comic.crawls
+        ],
+    }
+
+
+def serialize_comic_table_row(comic, app_dict):
+    """/api/comics_table用の辞書を作る"""
+    fragments = app_fragments(app_dict)
+    return {
+        'title': comic.title,
+        'title_kana': comic.title_kana,
+        'author': comic.author,
+        'raw_author': comic.raw_author,
+        'apps': [
+            {**fragments[crawl.app_id].table, 'url': crawl.url, 'crawled_at': format_date(crawl.crawled_at)}
+            for crawl in comic.crawls
+        ],
+    }
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """jsonifyなどの書き出しをorjsonで行うJSONプロバイダー
+
+    キーの並べ替えとインデントは標準のjsonと同じにする．日時などorjsonと
+    Flaskで書き方の違う型はFlaskと同じ変換にする．ASCII以外の文字はエスケープせずUTF-8で書く．
+    orjsonで扱えない引数のときは標準のjsonで書き出す．
+    """
+    def dumps(self, obj, **kwargs):
+        if set(kwargs) - {'indent', 'separators'} or kwargs.get('indent') not in (None, 2):
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        return orjson.dumps(obj, default=self.default, option=option).decode('utf-8')
+
+
+if orjson is not None and app.config['JSON_ENCODER'] == 'orjson':
+    app.json = OrjsonProvider(app)
+JSON_ENCODER = 'orjson' if isinstance(app.json, OrjsonProvider) else 'json'
@@ -0,0 +1,99 @@
+import hashlib
+import datetime
+import threading
+from functools import partial
+from collections import namedtuple
+
+from flask import request
+
+from app import app
+from app.cache import VersionedCache, app_registry
+from app.compression import choose_encoding, compress_all
+from app.comic_rows import iter_comic_rows
+from app.serializers import serialize_comic, serialize_comic_table_row
+from app.streaming import iter_json_data, stream_json_data
+
+
+# compressedはエンコーディング→圧縮したbody
+Snapshot = namedtuple('Snapshot', ['body', 'etag', 'last_modified', 'compressed'])
+
+
+def make_snapshot(serializer):
+    """全件の{"data": [...]}をjsonifyと同じバイト列で作ってハッシュを取る
+
+    圧縮もここで済ませておき，リクエストごとには圧縮しない．
+    """
+    app_dict = app_registry.get()
+    items = map(partial(serializer, app_dict=app_dict), iter_comic_rows())
+    body = ''.join(iter_json_data(items)).encode('utf-8')
+    return Snapshot(
+        body=body,
+        etag=hashlib.sha256(body).hexdigest()[:32],
+        last_modified=datetime.datetime.now(datetime.timezone.utc).replace(microsecond=0),
+        compressed=compress_all(body),
+    )
+
+
+# カタログかAppが更新されたときだけ，リクエストを待たせずにバックグラウンドで作り直す
+comics_snapshot = VersionedCache(('catalog', 'app'), partial(make_snapshot, serialize_comic), background=True)
+comics_table_snapshot = VersionedCache(('catalog', 'app'), partial(make_snapshot, serialize_comic_table_row),
+                                       background=True)
+SNAPSHOT_SERIALIZERS = {
+    comics_snapshot: serialize_comic,
+    comics_table_snapshot: serialize_comic_table_row,
+}
+
+
+def rebuild_snapshots():
+    """クロールの保存後に呼んで，このプロセスで作ってあるスナップショットを作り直す
+
+    crawl-workerのようにスナップショットを返さないプロセスでは何もしない．
+    Webのプロセスでは保存のバージョンの更新を見て，それぞれ作り直す．
+    """
+    for snapshot in (comics_snapshot, comics_table_snapshot):
+        if snapshot.ready:
+            snapshot.reload_in_background()
+
+
+_warm_up_lock = threading.Lock()
+_warm_up_started = False
+
+
+def warm_up_snapshots():
+    """スナップショットをバックグラウンドで作り始める（プロセスで1回だけ）
+
+    最初のリクエストで呼び，全件のAPIのリクエストが作成と圧縮を待たずに済むようにする．
+    """
+    global _warm_up_started
+    if _warm_up_started:
+        return
+    with _warm_up_lock:
+        if _warm_up_started:
+            return
+        _warm_up_started = True
+    for snapshot in (comics_snapshot, comics_table_snapshot):
+        snapshot.reload_in_background()
+
+
+def snapshot_response(snapshot_cache):
+    """スナップショットをETag, Last-Modified付きで返す（一致すれば304）
+
+    クライアントが受け付けるなら作っておいた圧縮済みのbodyを返す．
+    まだ作っていなければ作成と圧縮を待たずに，同じ内容をDBから少しずつ読みながら返す．
+    """
+    snapshot = snapshot_cache.get(wait=False)
+    if snapshot is None:
+        serializer = partial(SNAPSHOT_SERIALIZERS[snapshot_cache], app_dict=app_registry.get())
+        return stream_json_data(map(serializer, iter_comic_rows()))
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding in snapshot.compressed:
+        response = app.response_class(snapshot.compressed[encoding], mimetype=app.json.mimetype)
+        response.headers['Content-Encoding'] = encoding
+        response.set_etag(f'{snapshot.etag}-{encoding}')
+    else:
+        response = app.response_class(snapshot.body, mimetype=app.json.mimetype)
+        response.set_etag(snapshot.etag)
+    response.last_modified = snapshot.last_modified
+    # キャッシュしてもよいが毎回ETagで確認してもらう
+    response.cache_control.no_cache = True
+    return response.make_conditional(request)
@@ -0,0 +1,54 @@
+from flask import stream_with_context
+
+from app import app
+
+
+def _dump_args():
+    """jsonifyと同じ整形の引数を返す"""
+    if (app.json.compact is None and app.debug) or app.json.compact is False:
+        return {'indent': 2}
+    return {'separators': (',', ':')}
+
+
+def iter_json_data(items, chunk_size=100):
+    """{"data": [...]}をjsonifyと同じバイト列になるように少しずつ書き出す"""
+    dump_args = _dump_args()
+    indent = 'indent' in dump_args
+    if indent:
+        head, sep, tail, empty = '{\n  "data": [\n    ', ',\n    ', '\n  ]\n}\n', '{\n  "data": []\n}\n'
+    else:
+        head, sep, tail, empty = '{"data":[', ',', ']}\n', '{"data":[]}\n'
+
+    buffer = []
+    for item in items:
+        text = app.json.dumps(item, **dump_args)
+        if indent:
+            # 配列の要素として2段深くインデントする（文字列中の改行はエスケープ済み）
+            text = text.replace('\n', '\n    ')
+        if head is None:
+            buffer.append(sep + text)
+        else:
+            # 最初の要素はすぐに送る
+            yield head + text
+            head = None
+        if len(buffer) >= chunk_size:
+            yield ''.join(buffer)
+            buffer = []
+    if head is not None:
+        yield empty
+        return
+    buffer.append(tail)
+    yield ''.join(buffer)
+
+
+def stream_json_data(items):
+    """itemsを{"data": [...]}としてチャンクで返すレスポンスを作る"""
+    return app.response_class(
+        stream_with_context(iter_json_data(items)),
+        mimetype=app.json.mimetype,
+    )
+
+
+def stream_requested(args):
+    """リクエストのstreamが1かtrueのときだけストリーミングする（0やfalseなどはしない）"""
+    return args.get('stream', '').strip().lower() in ('1', 'true')
@@ -0,0 +1,105 @@
+"""Seleniumのクローラーのブラウザ起動コストのベンチマーク
+
+ローカルに立てた静的なHTTPサーバーの一覧ページと詳細ページを，
+クロールのたびにChromeを起動する従来の方法と，BrowserPoolで使い回す方法で
+読み込んで比較する．ChromeとchromedriverがPATHにある環境で実行する．
+
+    python -m benchmarks.bench_browser [--crawls 3] [--pages 40] [--tabs 1 4]
+"""
+import os
+import time
+import argparse
+import tempfile
+import threading
+from functools import partial
+from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+
+from benchmarks.common import setup_app, timer
+
+
+class QuietHandler(SimpleHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+
+def start_server(pages):
+    """一覧ページとpages件の詳細ページを返すサーバーを立てる"""
+    root = tempfile.mkdtemp()
+    links = ''.join(f'<a class="title" href="/detail/{i}.html">title{i}</a>' for i in range(pages))
+    with open(os.path.join(root, 'index.html'), 'w') as f:
+        f.write(f'<html><body>{links}</body></html>')
+    os.makedirs(os.path.join(root, 'detail'))
+    for i in range(pages):
+        with open(os.path.join(root, 'detail', f'{i}.html'), 'w') as f:
+            f.write(f'<html><body><h1 class="name">title{i}</h1><p class="author">作者{i}</p></body></html>')
+    server = ThreadingHTTPServer(('127.0.0.1', 0), partial(QuietHandler, directory=root))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def read_detail(driver, url):
+    from selenium.webdriver.common.by import By
+    return driver.find_element(By.CSS_SELECTOR, '.name').text
+
+
+def list_urls(driver, base_url):
+    from selenium.webdriver.common.by import By
+    driver.get(base_url + '/index.html')
+    return [a.get_attribute('href') for a in driver.find_elements(By.CSS_SELECTOR, '.title')]
+
+
+def crawl_cold(base_url):
+    """変更前と同じく，クロールのたびにドライバーを解決してChromeを起動する"""
+    from selenium import webdriver
+    from webdriver_manager.chrome import ChromeDriverManager
+    driver = webdriver.Chrome(ChromeDriverManager().install())
+    try:
+        urls = list_urls(driver, base_url)
+        titles = []
+        for url in urls:
+            driver.get(url)
+            titles.append(read_detail(driver, url))
+    finally:
+        driver.quit()
+    return titles
+
+
+def crawl_pooled(base_url, tabs):
+    from app.browser import browser_pool
+    with browser_pool.driver() as driver:
+        urls = list_urls(driver, base_url)
+    return list(browser_pool.map(read_detail, urls, 'bench', tabs=tabs))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--crawls', type=int, default=3)
+    parser.add_argument('--pages', type=int, default=40)
+    parser.add_argument('--tabs', type=int, nargs='+', default=[1, 4])
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from app.browser import browser_pool
+    server, base_url = start_server(args.pages)
+    expected = [f'title{i}' for i in range(args.pages)]
+    print(f'{"path":<12} | {"first [s]":>9} | {"per crawl [s]":>13}')
+    try:
+        with app.app_context():
+            paths = [('cold', crawl_cold)] + [(f'pool tabs={tabs}', partial(crawl_pooled, tabs=tabs)) for tabs in args.tabs]
+            for name, crawl in paths:
+                result = {}
+                with timer(result, 'first'):
+                    assert crawl(base_url) == expected, 'titles differ'
+                start = time.perf_counter()
+                for _ in range(args.crawls - 1):
+                    assert crawl(base_url) == expected, 'titles differ'
+                per_crawl = (time.perf_counter() - start) / max(args.crawls - 1, 1)
+                print(f'{name:<12} | {result["first"]:>9.3f} | {per_crawl:>13.3f}')
+            print(browser_pool.stats)
+    finally:
+        browser_pool.close()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
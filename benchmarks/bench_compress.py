@@ -0,0 +1,77 @@
+"""全件のJSON（/api/comics，/api/comics_table）の圧縮のベンチマーク
+
+合成したカタログのスナップショットのbodyを，gzipとbrotliの強さごとに圧縮して
+圧縮率とCPU時間を測る．また，APIにAccept-Encodingを付けてリクエストしたときの
+1リクエストあたりの時間を，圧縮しないとき，作っておいた圧縮済みのbodyを返すとき，
+リクエストごとに圧縮したときで比べる．
+
+    python -m benchmarks.bench_compress [--comics 20000] [--requests 20]
+"""
+import time
+import argparse
+
+from benchmarks.common import setup_app, seed_catalog
+
+
+LEVELS = {'gzip': [1, 6, 9], 'br': [1, 4, 9]}
+
+
+def cpu_time(func, repeat=1):
+    """funcの1回あたりのCPU時間（秒）と結果"""
+    start = time.process_time()
+    for _ in range(repeat):
+        result = func()
+    return (time.process_time() - start) / repeat, result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comics', type=int, default=20000)
+    parser.add_argument('--requests', type=int, default=20)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from app.compression import compress, available_encodings
+    from app.snapshot import comics_snapshot, comics_table_snapshot
+    app.config['SEARCH_INDEX_WARM_UP'] = False
+    app.config['SNAPSHOT_WARM_UP'] = False
+    with app.app_context():
+        comics_num, crawls_num = seed_catalog(db, args.comics)
+        build_seconds = {}
+        snapshots = {}
+        for path, snapshot_cache in (('/api/comics', comics_snapshot), ('/api/comics_table', comics_table_snapshot)):
+            build_seconds[path], snapshots[path] = cpu_time(snapshot_cache.reload)
+    print(f'{comics_num} comics, {crawls_num} crawls, encodings: {", ".join(available_encodings())}')
+
+    print(f'{"endpoint":<18} | {"encoding":<8} | {"level":>5} | {"size [KB]":>10} | {"ratio":>6} | {"CPU [ms]":>9}')
+    for path, snapshot in snapshots.items():
+        body = snapshot.body
+        print(f'{path:<18} | {"identity":<8} | {"-":>5} | {len(body) / 1024:>10.0f} | {1:>6.2f} | {"-":>9}')
+        for encoding in available_encodings():
+            for level in LEVELS[encoding]:
+                seconds, compressed = cpu_time(lambda: compress(body, encoding, level))
+                print(f'{path:<18} | {encoding:<8} | {level:>5} | {len(compressed) / 1024:>10.0f} | '
+                      f'{len(body) / len(compressed):>6.2f} | {seconds * 1000:>9.1f}')
+        print(f'{path:<18} snapshot build (including compression): {build_seconds[path] * 1000:.0f} ms CPU')
+
+    # 1リクエストあたりの時間（スナップショットは作ってあるので，圧縮済みなら圧縮しない）
+    client = app.test_client()
+    print(f'{"endpoint":<18} | {"response":<22} | {"CPU per request [ms]":>20} | {"bytes":>10}')
+    for path, snapshot in snapshots.items():
+        cases = [('identity', {}, None)]
+        for encoding in available_encodings():
+            cases.append((f'{encoding} (cached)', {'Accept-Encoding': encoding}, None))
+            cases.append((f'{encoding} (per request)', {}, encoding))
+        for label, headers, encoding in cases:
+            def request():
+                res = client.get(path, headers=headers)
+                data = res.get_data()
+                if encoding is not None:
+                    data = compress(data, encoding)
+                return data
+            seconds, data = cpu_time(request, args.requests)
+            print(f'{path:<18} | {label:<22} | {seconds * 1000:>20.2f} | {len(data):>10}')
+
+
+if __name__ == '__main__':
+    main()
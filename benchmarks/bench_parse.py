@@ -0,0 +1,192 @@
+"""一覧ページの解析時間とメモリのベンチマーク
+
+サイトごとに実際のページと同じ構造の一覧ページ（周りにナビゲーションや
+スクリプトなどの要素も入れたもの）を作り，ComicCrawlerの各クロール関数を
+そのページに対して実行する．従来のhtml.parserでページ全体を解析する方法，
+lxmlでページ全体を解析する方法，lxmlで一覧の要素だけを解析する方法
+（HTML_PARSE_MODE='fast'）を比べ，取り出した作品が同じことも確かめる．
+
+    python -m benchmarks.bench_parse [--items 300] [--noise 3000]
+"""
+import json
+import html
+import time
+import random
+import argparse
+import tracemalloc
+from urllib.parse import urljoin
+
+from benchmarks.common import setup_app, make_title
+
+
+def noise(rng, n):
+    """一覧以外の要素（ナビゲーション，広告，スクリプトなど）"""
+    parts = ['<header><nav><ul>']
+    parts += [f'<li class="nav-item"><a href="/nav/{i}"><span>メニュー{i}</span></a></li>' for i in range(n // 10)]
+    parts.append('</ul></nav></header>')
+    parts += [f'<div class="banner banner-{i}"><img src="/img/{i}.png" alt="広告{i}"><p>{make_title(rng, i)}</p></div>'
+              for i in range(n)]
+    parts.append('<script>window.__STATE__ = ' + json.dumps({'items': list(range(n))}) + ';</script>')
+    return ''.join(parts)
+
+
+def page(rng, body, noise_num):
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>一覧</title></head><body>'
+            f'{noise(rng, noise_num // 2)}<main>{body}</main>{noise(rng, noise_num // 2)}'
+            f'<footer><p>footer</p></footer></body></html>').encode()
+
+
+def gangan_online(rng, site_url, items, noise_num):
+    body = ''.join(f'<a class="SearchTitle_title__aBc12" href="/title/{i}">'
+                   f'<p class="SearchTitle_title__name__dEf34">{make_title(rng, i)}</p>'
+                   f'<p class="SearchTitle_title__author__gHi56">原作／作者A　漫画／作者B</p></a>' for i in range(items))
+    return {f'{site_url}/search': page(rng, body, noise_num)}
+
+
+def daily_series(rng, site_url, items, noise_num):
+    body = '<ul>' + ''.join(f'<li class="daily-series-item"><a href="{site_url}/episode/{i}">'
+                            f'<h4 class="daily-series-title">{make_title(rng, i)}</h4>'
+                            f'<h5 class="daily-series-author">原作/作者A 漫画/作者B</h5></a></li>' for i in range(items)) + '</ul>'
+    return {urljoin(site_url, '/series'): page(rng, body, noise_num)}
+
+
+def sunday_webry(rng, site_url, items, noise_num):
+    pages = {}
+    for path in ('/series', '/series/yoru-sunday'):
+        body = ''.join(f'<a class="webry-series-item-link" href="/episode{path}/{i}">'
+                       f'<h4 class="series-title">{make_title(rng, i)}</h4><p class="author">作者A/作者B</p></a>' for i in range(items // 2))
+        pages[urljoin(site_url, path)] = page(rng, body, noise_num)
+    return pages
+
+
+def manga_bang(rng, site_url, items, noise_num):
+    pages = {}
+    for i, num in enumerate((items, 0), 1):
+        props = {'list': {'book_titles': [{'title': make_title(rng, j), 'author_name': '作者A', 'key': f'/{i}{j}'} for j in range(num)]}}
+        body = f'<div class="js-react-on-rails-component" data-props="{html.escape(json.dumps(props))}"></div>'
+        pages[urljoin(site_url, f'/freemium/book_titles?page={i}')] = page(rng, body, noise_num)
+    return pages
+
+
+def manga_up(rng, site_url, items, noise_num):
+    body = '<ul>' + ''.join(f'<li><a href="detail/{i}"><p class="ttl">{make_title(rng, i)}</p>'
+                            f'<p class="artist">原作:作者A・作者B<br>漫画:作者C</p></a></li>' for i in range(items)) + '</ul>'
+    return {urljoin(site_url, 'original'): page(rng, body, noise_num)}
+
+
+def shonen_jump_plus(rng, site_url, items, noise_num):
+    pages = {}
+    for path in ('/series', '/series/finished'):
+        body = '<ul>' + ''.join(f'<li class="series-list-item"><a href="{site_url}/episode{path}/{i}">'
+                                f'<h2 class="series-list-title">{make_title(rng, i)}</h2>'
+                                f'<h3 class="series-list-author">作者A/作者B</h3></a></li>' for i in range(items // 2)) + '</ul>'
+        pages[urljoin(site_url, path)] = page(rng, body, noise_num)
+    return pages
+
+
+def ura_sunday(rng, site_url, items, noise_num):
+    # 連載中作品は詳細ページも読むので件数を減らす
+    serial = items // 10
+    pages = {}
+    body = '<div class="title-all-list"><ul>' + ''.join(f'<li><a href="/title/{i}">作品{i}</a></li>' for i in range(serial)) + '</ul></div>'
+    pages[urljoin(site_url, '/serial_title')] = page(rng, body, noise_num)
+    for i in range(serial):
+        body = f'<div class="info"><h1> {make_title(rng, i)} </h1><div class="author">作者：作者A　作画：作者B</div></div>'
+        pages[urljoin(site_url, f'/title/{i}')] = page(rng, body, noise_num)
+    body = '<div class="title-all-list"><ul>' + ''.join(
+        f'<li><a href="/title/c{i}"><h2>{make_title(rng, i)}</h2><div><div>作者:作者A　作画:作者B</div></div></a></li>'
+        for i in range(items)) + '</ul></div>'
+    pages[urljoin(site_url, '/complete_title')] = page(rng, body, noise_num)
+    return pages
+
+
+SITES = [
+    ('ガンガンONLINE', 'https://www.ganganonline.com', gangan_online),
+    ('コミックDAYS', 'https://comic-days.com', daily_series),
+    ('サンデーうぇぶり', 'https://www.sunday-webry.com', sunday_webry),
+    ('マガポケ', 'https://pocket.shonenmagazine.com', daily_series),
+    ('マンガBANG！', 'https://manga-bang.com', manga_bang),
+    ('マンガUP！', 'https://magazine.jp.square-enix.com/mangaup/', manga_up),
+    ('少年ジャンプ＋', 'https://shonenjumpplus.com', shonen_jump_plus),
+    ('裏サンデー', 'https://urasunday.com', ura_sunday),
+]
+
+# (表示名, HTML_PARSE_MODE, 一覧の要素だけを解析するか)
+VARIANTS = [
+    ('html.parser', 'full', False),
+    ('lxml', 'fast', False),
+    ('lxml+strainer', 'fast', True),
+]
+
+
+def make_fixture_crawler():
+    from app.crawler import ComicCrawler, make_soup
+    from app.robots import RobotsTxt
+
+    class FixtureCrawler(ComicCrawler):
+        """通信せずに用意したページを解析するクローラー"""
+        def __init__(self, app_record, pages, strain, trace):
+            self.app_record = app_record
+            self.crawl_func = getattr(self, self.CRAWL_FUNCS[app_record.name])
+            self.robots_txt = RobotsTxt(app_record.site_url, '')
+            self.comics = []
+            self.crawl_history = None
+            self.fetch_timings = []
+            self.pages = pages
+            self.strain = strain
+            self.trace = trace
+            self.parse_seconds = 0
+            self.peak = 0
+
+        def get_soup(self, url, parse_only=None):
+            content = self.pages[url]
+            if self.trace:
+                tracemalloc.reset_peak()
+                base = tracemalloc.get_traced_memory()[0]
+            # 詳細ページは複数のスレッドで解析するので，スレッドごとのCPU時間を足す
+            start = time.thread_time()
+            soup = make_soup(content, parse_only if self.strain else None)
+            self.parse_seconds += time.thread_time() - start
+            if self.trace:
+                self.peak = max(self.peak, tracemalloc.get_traced_memory()[1] - base)
+            return soup
+
+    return FixtureCrawler
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--items', type=int, default=300)
+    parser.add_argument('--noise', type=int, default=3000)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from app.models import App
+    FixtureCrawler = make_fixture_crawler()
+    with app.app_context():
+        for i, (name, site_url, _) in enumerate(SITES, 1):
+            db.session.add(App(id=i, name=name, img_url='', site_url=site_url))
+        db.session.add(App(id=len(SITES) + 1, name='マンガワン', img_url=''))
+        db.session.commit()
+
+        print(f'{"site":<16} | {"parser":<13} | {"parse [s]":>9} | {"peak [MB]":>9} | {"comics":>6}')
+        rng = random.Random(0)
+        for name, site_url, build in SITES:
+            pages = build(rng, site_url, args.items, args.noise)
+            app_record = App.query.filter_by(name=name).first()
+            results = {}
+            for label, mode, strain in VARIANTS:
+                app.config['HTML_PARSE_MODE'] = mode
+                crawler = FixtureCrawler(app_record, pages, strain, trace=False)
+                assert crawler.crawl_func()['status_code'] == 200, name
+                tracemalloc.start()
+                traced = FixtureCrawler(app_record, pages, strain, trace=True)
+                traced.crawl_func()
+                tracemalloc.stop()
+                results[label] = [{k: v for k, v in comic.items() if k != 'crawled_at'} for comic in crawler.comics]
+                print(f'{name:<16} | {label:<13} | {crawler.parse_seconds:>9.3f} | {traced.peak / 2 ** 20:>9.2f} | {len(crawler.comics):>6}')
+            assert all(comics == results['html.parser'] for comics in results.values()), f'{name}: comics differ'
+
+
+if __name__ == '__main__':
+    main()
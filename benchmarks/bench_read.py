@@ -0,0 +1,109 @@
+"""一覧のAPIでComicとCrawlを読み込む処理のベンチマーク
+
+合成したカタログ（既定で約10万件のCrawl）から，変更前と同じ読み方（ORMのComicと
+Crawlを作る．全件はselectinload，それ以外はjoinedload）と，app.comic_rowsで必要な
+列だけをタプルで読んでまとめる今の読み方で，全件，ページ（limit），id指定，1件の
+それぞれの時間と，読み込んだ結果を全て持ったときのメモリのピークを比べる．
+serialize_comicで作ったJSONが同じになることも確かめる．
+
+    python -m benchmarks.bench_read [--comics 33400] [--limit 50] [--ids 500] [--repeat 3]
+"""
+import time
+import random
+import argparse
+import tracemalloc
+
+from benchmarks.common import setup_app, seed_catalog
+
+
+def measure(db, load, repeat):
+    """loadの最短の時間（秒）と結果．毎回セッションを作り直してidentity mapを空にする"""
+    best = None
+    for _ in range(repeat):
+        db.session.remove()
+        start = time.perf_counter()
+        comics = list(load())
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+    return best, comics
+
+
+def peak_memory(db, load):
+    """loadの結果を全て持ったときのメモリのピーク（MB）"""
+    db.session.remove()
+    tracemalloc.start()
+    comics = list(load())
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del comics
+    return peak / 1024 / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comics', type=int, default=33400)
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--ids', type=int, default=500)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from sqlalchemy import or_, and_
+    from sqlalchemy.orm import joinedload, selectinload
+    from app.cache import app_registry
+    from app.models import Comic
+    from app.comic_rows import load_comic, load_comics, iter_comic_rows
+    from app.pagination import paginate_comics
+    from app.serializers import serialize_comic
+    app.config['SEARCH_INDEX_WARM_UP'] = False
+    app.config['SNAPSHOT_WARM_UP'] = False
+
+    def legacy_iter_all():
+        return Comic.query.options(selectinload(Comic.crawls)).order_by(Comic.id).yield_per(app.config['STREAM_YIELD_PER'])
+
+    def legacy_paginate(after):
+        query = Comic.query.options(joinedload(Comic.crawls))
+        title_kana, comic_id = after
+        query = query.filter(or_(
+            Comic.title_kana > title_kana,
+            and_(Comic.title_kana == title_kana, Comic.id > comic_id),
+        ))
+        return query.order_by(Comic.title_kana, Comic.id).limit(args.limit + 1).all()[:args.limit]
+
+    def legacy_load_comics(comic_ids):
+        comics = Comic.query.filter(Comic.id.in_(comic_ids)).options(joinedload(Comic.crawls)).all()
+        comic_dict = {comic.id: comic for comic in comics}
+        return [comic_dict[comic_id] for comic_id in comic_ids if comic_id in comic_dict]
+
+    with app.app_context():
+        comics_num, crawls_num = seed_catalog(db, args.comics)
+        app_dict = app_registry.get()
+        rng = random.Random(0)
+        middle = Comic.query.order_by(Comic.title_kana, Comic.id).offset(comics_num // 2).first()
+        after = (middle.title_kana, middle.id)
+        comic_ids = rng.sample(range(1, comics_num + 1), min(args.ids, comics_num))
+        comic_id = comic_ids[0]
+        cases = [
+            ('all', legacy_iter_all, iter_comic_rows),
+            (f'limit {args.limit}', lambda: legacy_paginate(after), lambda: paginate_comics(args.limit, after)[0]),
+            (f'{len(comic_ids)} ids', lambda: legacy_load_comics(comic_ids), lambda: load_comics(comic_ids)),
+            ('1 comic', lambda: [Comic.query.filter_by(id=comic_id).options(joinedload(Comic.crawls)).first()],
+             lambda: [load_comic(comic_id)]),
+        ]
+        print(f'{comics_num} comics, {crawls_num} crawls')
+        print(f'{"case":<10} | {"ORM [ms]":>9} | {"tuples [ms]":>11} | {"speedup":>7} | '
+              f'{"ORM [MB]":>8} | {"tuples [MB]":>11}')
+        for name, legacy, current in cases:
+            legacy_seconds, legacy_comics = measure(db, legacy, args.repeat)
+            legacy_json = [serialize_comic(comic, app_dict) for comic in legacy_comics]
+            current_seconds, current_comics = measure(db, current, args.repeat)
+            current_json = [serialize_comic(comic, app_dict) for comic in current_comics]
+            assert legacy_json == current_json, f'{name}: output differs'
+            legacy_mb = peak_memory(db, legacy)
+            current_mb = peak_memory(db, current)
+            print(f'{name:<10} | {legacy_seconds * 1000:>9.1f} | {current_seconds * 1000:>11.1f} | '
+                  f'{legacy_seconds / current_seconds:>6.1f}x | {legacy_mb:>8.1f} | {current_mb:>11.1f}')
+
+
+if __name__ == '__main__':
+    main()
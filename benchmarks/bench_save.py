@@ -0,0 +1,77 @@
+"""ComicCrawler.save()の保存時間のベンチマーク
+
+1件ずつCrawl.add_crawlする従来の方法と，Crawl.bulk_add_crawlsでまとめて
+保存する方法を，作品数を変えて比較する．初回のクロール（全て新規）と
+再クロール（全て既存）の両方を測る．
+
+    python -m benchmarks.bench_save [--sizes 100 500 1000 2000] [--db-url URL]
+"""
+import argparse
+
+from benchmarks.common import setup_app, seed_apps, make_crawl_datas, count_statements, timer
+
+
+def save_one_by_one(db, crawl_datas):
+    """変更前のsave()と同じ処理"""
+    from app.models import Crawl
+    Crawl.query.filter_by(app_id=1).delete()
+    db.session.commit()
+    for crawl_data in crawl_datas:
+        Crawl.add_crawl(crawl_data)
+
+
+def save_bulk(db, crawl_datas):
+    from app.models import Crawl
+    Crawl.query.filter_by(app_id=1).delete()
+    Crawl.bulk_add_crawls(crawl_datas)
+    db.session.commit()
+
+
+def snapshot(db):
+    """保存結果を比較できる形で取り出す"""
+    from app.models import Comic, Crawl
+    comics = sorted(db.session.query(Comic.title, Comic.title_kana, Comic.author, Comic.raw_author).all())
+    crawls = sorted(db.session.query(Comic.title, Crawl.url).join(Crawl, Crawl.comic_id == Comic.id).all())
+    return comics, crawls
+
+
+def run(app, db, save, crawl_datas):
+    result = {}
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        seed_apps(db)
+        # 初回のクロール
+        with count_statements(db.engine) as counts, timer(result, 'first'):
+            save(db, crawl_datas)
+        result['first_statements'] = counts['statements']
+        # 同じ作品の再クロール
+        with count_statements(db.engine) as counts, timer(result, 'again'):
+            save(db, crawl_datas)
+        result['again_statements'] = counts['statements']
+        result['snapshot'] = snapshot(db)
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sizes', type=int, nargs='+', default=[100, 500, 1000, 2000])
+    parser.add_argument('--db-url')
+    args = parser.parse_args()
+
+    app, db = setup_app(args.db_url)
+    print(f'{"comics":>7} | {"path":<11} | {"first [s]":>9} | {"stmts":>6} | {"re-crawl [s]":>12} | {"stmts":>6}')
+    for size in args.sizes:
+        crawl_datas = make_crawl_datas(size)
+        # 同じタイトルが複数回出てくる場合も含める
+        crawl_datas += [dict(crawl_data, url=crawl_data['url'] + '/dup') for crawl_data in crawl_datas[:size // 10]]
+        results = {}
+        for name, save in (('one-by-one', save_one_by_one), ('bulk', save_bulk)):
+            results[name] = result = run(app, db, save, crawl_datas)
+            print(f'{size:>7} | {name:<11} | {result["first"]:>9.3f} | {result["first_statements"]:>6} '
+                  f'| {result["again"]:>12.3f} | {result["again_statements"]:>6}')
+        assert results['one-by-one']['snapshot'] == results['bulk']['snapshot'], 'saved rows differ'
+
+
+if __name__ == '__main__':
+    main()
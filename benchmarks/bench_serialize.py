@@ -0,0 +1,133 @@
+"""/api/comic，/api/comics，/api/comics_tableのJSONの作成のベンチマーク
+
+合成したカタログのComicを読み込んでおき，変更前と同じ作り方（Crawlごとにアプリの
+情報を引いてstrftimeし，標準のjsonで書き出す），app.serializersで作って標準のjsonで
+書き出す方法，app.serializersとapp.json（JSON_ENCODER）で書き出す今の方法で，
+1秒あたりに書き出せる作品数を比べる．結果が同じJSONになることも確かめる．
+
+    python -m benchmarks.bench_serialize [--comics 20000] [--repeat 3]
+"""
+import json
+import time
+import argparse
+
+from benchmarks.common import setup_app, seed_catalog
+
+
+def legacy_comic_detail(comic, app_dict):
+    return {
+        'id': comic.id,
+        'title': comic.title,
+        'title_kana': comic.title_kana,
+        'author': comic.author,
+        'raw_author': comic.raw_author,
+        'apps': [
+            {
+                'name': app_dict[crawl.app_id].name,
+                'img_url': app_dict[crawl.app_id].abs_img_url,
+                'platform_type': app_dict[crawl.app_id].platform_type,
+                'app_store_url': app_dict[crawl.app_id].app_store_url,
+                'google_play_url': app_dict[crawl.app_id].google_play_url,
+                'site_url': app_dict[crawl.app_id].site_url,
+                'url': crawl.url,
+                'crawled_at': crawl.crawled_at.strftime('%Y/%m/%d'),
+            }
+            for crawl in comic.crawls
+        ],
+    }
+
+
+def legacy_comic(comic, app_dict):
+    return {
+        'id': comic.id,
+        'title': comic.title,
+        'title_kana': comic.title_kana,
+        'author': comic.author,
+        'raw_author': comic.raw_author,
+        'apps': [
+            {
+                'name': app_dict[crawl.app_id].name,
+                'img_url': app_dict[crawl.app_id].abs_img_url,
+                'url': crawl.url,
+                'crawled_at': crawl.crawled_at.strftime('%Y/%m/%d'),
+            }
+            for crawl in comic.crawls
+        ],
+    }
+
+
+def legacy_comic_table_row(comic, app_dict):
+    return {
+        'title': comic.title,
+        'title_kana': comic.title_kana,
+        'author': comic.author,
+        'raw_author': comic.raw_author,
+        'apps': [
+            {
+                'app_name': app_dict[crawl.app_id].name,
+                'url': crawl.url,
+                'crawled_at': crawl.crawled_at.strftime('%Y/%m/%d'),
+            }
+            for crawl in comic.crawls
+        ],
+    }
+
+
+def legacy_dumps(obj, compact):
+    """変更前のapp.json.dumps（標準のjson，キーを並べ替えてASCIIにエスケープ）"""
+    if compact:
+        return json.dumps(obj, ensure_ascii=True, sort_keys=True, separators=(',', ':'))
+    return json.dumps(obj, ensure_ascii=True, sort_keys=True, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comics', type=int, default=20000)
+    parser.add_argument('--repeat', type=int, default=3)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from sqlalchemy.orm import selectinload
+    from app.cache import app_registry
+    from app.models import Comic
+    from app.serializers import serialize_comic_detail, serialize_comic, serialize_comic_table_row, JSON_ENCODER
+    with app.app_context():
+        comics_num, crawls_num = seed_catalog(db, args.comics)
+        comics = Comic.query.options(selectinload(Comic.crawls)).order_by(Comic.id).all()
+        app_dict = app_registry.get()
+    print(f'{comics_num} comics, {crawls_num} crawls, JSON encoder: {JSON_ENCODER}')
+
+    serializers = [
+        ('/api/comic', legacy_comic_detail, serialize_comic_detail),
+        ('/api/comics', legacy_comic, serialize_comic),
+        ('/api/comics_table', legacy_comic_table_row, serialize_comic_table_row),
+    ]
+    print(f'{"endpoint":<18} | {"format":<7} | {"before [rows/s]":>15} | {"serializers [rows/s]":>20} | '
+          f'{"after [rows/s]":>14} | {"speedup":>7}')
+    for name, legacy, current in serializers:
+        for compact in (False, True):
+            dump_args = {'separators': (',', ':')} if compact else {'indent': 2}
+            paths = {
+                'before': lambda comic: legacy_dumps(legacy(comic, app_dict), compact),
+                'serializers': lambda comic: legacy_dumps(current(comic, app_dict), compact),
+                'after': lambda comic: app.json.dumps(current(comic, app_dict), **dump_args),
+            }
+            rates = {}
+            outputs = {}
+            for label, run in paths.items():
+                best = None
+                for _ in range(args.repeat):
+                    start = time.perf_counter()
+                    texts = [run(comic) for comic in comics]
+                    seconds = time.perf_counter() - start
+                    best = seconds if best is None else min(best, seconds)
+                rates[label] = len(comics) / best
+                outputs[label] = [json.loads(text) for text in texts]
+            assert outputs['before'] == outputs['serializers'] == outputs['after'], f'{name}: output differs'
+            label = 'compact' if compact else 'indent'
+            print(f'{name:<18} | {label:<7} | {rates["before"]:>15,.0f} | {rates["serializers"]:>20,.0f} | '
+                  f'{rates["after"]:>14,.0f} | {rates["after"] / rates["before"]:>6.1f}x')
+
+
+if __name__ == '__main__':
+    main()
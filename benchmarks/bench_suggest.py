@@ -0,0 +1,68 @@
+"""入力候補（/api/suggest）のベンチマーク
+
+合成したカタログでSuggestIndexを作る時間と，タイトル，ふりがな，ローマ字の
+1〜6文字の接頭辞で引いたときの応答時間の分布（インデックスだけと，APIを通したとき）を測る．
+
+    python -m benchmarks.bench_suggest [--comics 100000] [--queries 5000]
+"""
+import time
+import random
+import argparse
+import statistics
+
+from benchmarks.common import setup_app, seed_catalog
+
+
+def percentile(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comics', type=int, default=100000)
+    parser.add_argument('--queries', type=int, default=5000)
+    args = parser.parse_args()
+
+    app, db = setup_app()
+    from app.kana import to_romaji
+    from app.models import Comic
+    from app.search_index import suggest_index
+    app.config['SEARCH_INDEX_WARM_UP'] = False
+    app.config['SNAPSHOT_WARM_UP'] = False
+    with app.app_context():
+        comics_num, crawls_num = seed_catalog(db, args.comics)
+        print(f'{comics_num} comics, {crawls_num} crawls')
+        start = time.perf_counter()
+        suggest_index.ensure_built()
+        print(f'build: {time.perf_counter() - start:.2f} s, {len(suggest_index.entries)} entries, '
+              f'{len(suggest_index.top)} cached prefixes')
+
+        rng = random.Random(0)
+        rows = db.session.query(Comic.title, Comic.title_kana).all()
+        sample = rng.sample(rows, min(len(rows), args.queries))
+        romajis = to_romaji([title_kana for _, title_kana in sample])
+        queries = []
+        for (title, title_kana), romaji in zip(sample, romajis):
+            text = rng.choice([title, title_kana, romaji])
+            queries.append(text[:rng.randint(1, 6)])
+
+        client = app.test_client()
+        print(f'{"path":<6} | {"p50 [ms]":>8} | {"p99 [ms]":>8} | {"max [ms]":>8} | {"bytes":>6}')
+        for name, run in (('index', lambda q: suggest_index.suggest(q, 10)),
+                          ('api', lambda q: client.get('/api/suggest', query_string={'q': q}))):
+            timings = []
+            sizes = []
+            for q in queries:
+                start = time.perf_counter()
+                res = run(q)
+                timings.append((time.perf_counter() - start) * 1000)
+                if name == 'api':
+                    sizes.append(len(res.data))
+            size = f'{statistics.mean(sizes):>6.0f}' if sizes else f'{"-":>6}'
+            print(f'{name:<6} | {statistics.median(timings):>8.3f} | {percentile(timings, 0.99):>8.3f} | '
+                  f'{max(timings):>8.3f} | {size}')
+
+
+if __name__ == '__main__':
+    main()
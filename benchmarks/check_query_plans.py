@@ -0,0 +1,169 @@
+"""APIとクロールの保存で発行するクエリの実行計画の確認
+
+合成したカタログをDBに入れ，各APIと保存処理を実行して発行されたSQLを記録し，
+comic，crawl，crawl_historyをインデックスを使わずに全件読んでいるものが無いかを
+EXPLAINで確かめる．インデックス全体の走査（SQLiteのSCAN ... USING INDEX，MySQLの
+type=index）も全件の走査とみなし，ALLOWED_SCANSに理由とともに挙げたものだけを許す．
+全件読むものがあれば実行計画を表示して終了コード1で終わる．
+モデルやクエリを変えたときに実行する（README参照）．MySQLで確かめるときは--db-urlに
+空の検証用DBを指定する（テーブルを作り直すので本番のDBは指定しない）．
+
+    python -m benchmarks.check_query_plans [--comics 5000] [--db-url mysql+pymysql://...]
+"""
+import re
+import sys
+import random
+import datetime
+import argparse
+from contextlib import contextmanager
+
+from benchmarks.common import setup_app, seed_catalog, make_crawl_datas
+
+
+# 全件を読んではいけないテーブル（SQLAlchemyの別名のcrawl_1なども含む）
+CHECKED_TABLE = re.compile(r'^(comic|crawl|crawl_history)(_\d+)?$')
+
+# 意図して全体を読む（ケース名，テーブル）と，その理由．ここに無いものは全てNGにする
+LATEST_HISTORY = 'アプリごとの最新のidをGROUP BYで求めるため，ix_crawl_history_app_id_idだけを読む（行は読まない）'
+ALLOWED_SCANS = {
+    ('GET /api/app_status_table', 'crawl_history'): LATEST_HISTORY,
+    ('GET /api/app_status_4front', 'crawl_history'): LATEST_HISTORY,
+}
+
+
+def seed_histories(db, apps_num, days=60, seed=0):
+    """各アプリに1日1回ずつのCrawlHistoryを入れる"""
+    from sqlalchemy import insert
+    from app.models import CrawlHistory
+    rng = random.Random(seed)
+    start = datetime.datetime.now() - datetime.timedelta(days=days)
+    rows = []
+    for day in range(days):
+        for app_id in range(1, apps_num + 1):
+            rows.append({
+                'app_id': app_id,
+                'crawled_at': start + datetime.timedelta(days=day, hours=app_id),
+                'status': rng.choice(['success', 'success', 'failure']),
+                'comics_num': 1000,
+            })
+    db.session.execute(insert(CrawlHistory), rows)
+    db.session.commit()
+
+
+@contextmanager
+def record_statements(engine):
+    """ブロック内で発行されたSELECT，UPDATE，DELETE文とパラメータを記録する"""
+    from sqlalchemy import event
+    statements = []
+
+    def on_execute(conn, cursor, statement, parameters, context, executemany):
+        if not executemany and statement.lstrip().split(None, 1)[0].upper() in ('SELECT', 'UPDATE', 'DELETE'):
+            statements.append((statement, parameters))
+
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+
+
+def full_scans(conn, statement, parameters):
+    """EXPLAINの結果から，全件を読んでいるテーブルと実行計画を返す"""
+    if conn.dialect.name == 'sqlite':
+        plan = conn.exec_driver_sql(f'EXPLAIN QUERY PLAN {statement}', parameters).all()
+        lines = [row[-1] for row in plan]
+        # SCANは「SCAN comic USING [COVERING] INDEX ...」のようにインデックスを使っていても，
+        # インデックス全体を読むので全件の走査とみなす．範囲で読むものはSEARCHになる．
+        # AUTOMATIC INDEXはクエリのたびにテーブル全体を読んで作るので全件の走査とみなす
+        scans = [line.split()[1] for line in lines
+                 if line.startswith('SCAN ') or (line.startswith('SEARCH ') and 'AUTOMATIC' in line)]
+    else:
+        plan = conn.exec_driver_sql(f'EXPLAIN {statement}', parameters).mappings().all()
+        lines = [f'{row["table"]}: type={row["type"]} key={row["key"]} rows={row["rows"]} {row["Extra"] or ""}' for row in plan]
+        # type=indexはインデックス全体を読むので，ALLと同じく全件の走査とみなす
+        scans = [row['table'] for row in plan if row['type'] in ('ALL', 'index')]
+    return [table for table in scans if CHECKED_TABLE.match(table or '')], lines
+
+
+def run_save(app_id):
+    """クロールの保存と同じクエリを発行する（最後にロールバックする）"""
+    from app import db
+    from app.models import Comic, Crawl
+    crawl_datas = make_crawl_datas(200, app_id=app_id, seed=1)
+    Crawl.sync_crawls(app_id, crawl_datas)
+    Comic.add_comic(Comic(title=crawl_datas[0]['title'], title_kana='', author='', raw_author=''))
+    db.session.rollback()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--comics', type=int, default=5000)
+    parser.add_argument('--apps', type=int, default=5)
+    parser.add_argument('--db-url')
+    args = parser.parse_args()
+
+    app, db = setup_app(args.db_url)
+    from app.models import Comic
+    from app.cache import app_registry
+    from app.search_index import comic_index, kana_index
+    from app.pagination import encode_cursor
+    # バックグラウンドで作るインデックスのクエリが記録に混ざらないようにする
+    app.config['SEARCH_INDEX_WARM_UP'] = False
+    app.config['SNAPSHOT_WARM_UP'] = False
+    with app.app_context():
+        seed_catalog(db, args.comics, apps_num=args.apps)
+        seed_histories(db, args.apps)
+        if db.engine.dialect.name == 'sqlite':
+            db.session.execute(db.text('ANALYZE'))
+            db.session.commit()
+        # インメモリのキャッシュとインデックスは先に作っておき，リクエストごとのクエリだけを見る
+        app_registry.get()
+        comic_index.ensure_built()
+        kana_index.ensure_built()
+        middle = Comic.query.order_by(Comic.title_kana, Comic.id).offset(args.comics // 2).first()
+
+    client = app.test_client()
+    cursor = encode_cursor(middle.title_kana, middle.id)
+    cases = [
+        ('GET /api/comic', lambda: client.get(f'/api/comic?id={middle.id}')),
+        ('GET /api/comics?limit', lambda: client.get(f'/api/comics?limit=50&cursor={cursor}')),
+        ('GET /api/comics?fifty', lambda: client.get('/api/comics?fifty=か&limit=50')),
+        ('GET /api/comics?row', lambda: client.get('/api/comics?row=さ&limit=50')),
+        ('GET /api/comics?keywords', lambda: client.get('/api/comics?keywords=魔法&limit=50')),
+        ('GET /api/comics_table?limit', lambda: client.get(f'/api/comics_table?limit=50&cursor={cursor}')),
+        ('GET /api/app_status_table', lambda: client.get('/api/app_status_table')),
+        ('GET /api/app_status_4front', lambda: client.get('/api/app_status_4front')),
+        ('GET /api/crawl_schedule', lambda: client.get('/api/crawl_schedule')),
+        ('save', lambda: run_save(1)),
+    ]
+
+    failed = 0
+    for name, run in cases:
+        with app.app_context():
+            with record_statements(db.engine) as statements:
+                res = run()
+            assert res is None or res.status_code == 200, f'{name}: {res.status_code}'
+            with db.engine.connect() as conn:
+                for statement, parameters in statements:
+                    tables, lines = full_scans(conn, statement, parameters)
+                    for table in tables:
+                        if (name, table) in ALLOWED_SCANS:
+                            print(f'allowed {name}: full scan of {table} ({ALLOWED_SCANS[name, table]})')
+                    tables = [table for table in tables if (name, table) not in ALLOWED_SCANS]
+                    if not tables:
+                        continue
+                    failed += 1
+                    print(f'NG {name}: full scan of {", ".join(tables)}')
+                    print('  ' + ' '.join(statement.split()))
+                    for line in lines:
+                        print(f'    {line}')
+        print(f'{name:<28} {len(statements):>3} queries')
+
+    if failed:
+        print(f'{failed} queries read a whole table')
+        sys.exit(1)
+    print('OK')
+
+
+if __name__ == '__main__':
+    main()
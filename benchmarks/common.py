@@ -0,0 +1,112 @@
+"""ベンチマーク用の共通処理
+
+appはimport時にRAILWAY_MYSQL_URLを読むので，setup_app()を呼んでからappをimportする．
+"""
+import os
+import time
+import random
+import datetime
+import tempfile
+from contextlib import contextmanager
+
+
+KANA = 'あいうえおかきくけこさしすせそたちつてとなにぬねのはひふへほまみむめもやゆよらりるれろわをんがぎぐげござじずぜぞ'
+KANJI = '魔法少女王国剣士竜騎天使悪魔恋愛学園異世界転生探偵料理野球'
+
+
+def setup_app(db_url=None):
+    """ベンチマーク用のDBでappを初期化する（指定がなければ一時的なSQLite）"""
+    if db_url is None:
+        db_url = 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['RAILWAY_MYSQL_URL'] = db_url
+    from app import app, db
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+    return app, db
+
+
+def make_title(rng, i):
+    return ''.join(rng.choice(KANJI + KANA) for _ in range(rng.randint(2, 10))) + str(i)
+
+
+def make_crawl_datas(n, app_id=1, seed=0, crawled_at=None):
+    """Crawl.add_crawlに渡す形式の合成データをn件作る"""
+    rng = random.Random(seed)
+    crawled_at = crawled_at or datetime.datetime(2023, 8, 1)
+    crawl_datas = []
+    for i in range(n):
+        title = make_title(rng, i)
+        crawl_datas.append({
+            'title': title,
+            'title_kana': ''.join(rng.choice(KANA) for _ in range(rng.randint(2, 12))),
+            'author': rng.choice(['', '作者A,作者B', '作者C']),
+            'raw_author': rng.choice(['作者A 作者B', '作者C']),
+            'app_id': app_id,
+            'url': f'https://example.com/{app_id}/{i}',
+            'crawled_at': crawled_at,
+        })
+    return crawl_datas
+
+
+def seed_apps(db, n=5):
+    from app.models import App
+    for i in range(1, n + 1):
+        db.session.add(App(id=i, name=f'app{i}', img_url=f'/static/images/app/{i}.png', platform_type='both'))
+    db.session.commit()
+
+
+def seed_catalog(db, comics_num, apps_num=5, seed=0):
+    """comics_num件のComicと，各Comicに1〜apps_num件のCrawlを入れる"""
+    from sqlalchemy import insert
+    from app.models import Comic, Crawl
+    rng = random.Random(seed)
+    seed_apps(db, apps_num)
+    comic_rows, crawl_rows = [], []
+    for comic_id in range(1, comics_num + 1):
+        comic_rows.append({
+            'id': comic_id,
+            'title': make_title(rng, comic_id),
+            'title_kana': ''.join(rng.choice(KANA) for _ in range(rng.randint(2, 12))),
+            'author': '作者A,作者B',
+            'raw_author': '作者A 作者B',
+        })
+        for app_id in rng.sample(range(1, apps_num + 1), rng.randint(1, apps_num)):
+            crawl_rows.append({
+                'comic_id': comic_id,
+                'app_id': app_id,
+                'url': f'https://example.com/{app_id}/{comic_id}',
+                'crawled_at': datetime.datetime(2023, 7, rng.randint(1, 28), 12),
+            })
+    db.session.execute(insert(Comic), comic_rows)
+    db.session.execute(insert(Crawl), crawl_rows)
+    db.session.commit()
+    return len(comic_rows), len(crawl_rows)
+
+
+@contextmanager
+def count_statements(engine):
+    """ブロック内で発行されたSQL文とコミットの数を数える"""
+    from sqlalchemy import event
+    counts = {'statements': 0, 'commits': 0}
+
+    def on_execute(*args):
+        counts['statements'] += 1
+
+    def on_commit(*args):
+        counts['commits'] += 1
+
+    event.listen(engine, 'before_cursor_execute', on_execute)
+    event.listen(engine, 'commit', on_commit)
+    try:
+        yield counts
+    finally:
+        event.remove(engine, 'before_cursor_execute', on_execute)
+        event.remove(engine, 'commit', on_commit)
+
+
+@contextmanager
+def timer(result, key='seconds'):
+    start = time.perf_counter()
+    yield
+    result[key] = time.perf_counter() - start